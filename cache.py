@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from db import get_connection
+
+# --- Cache des lectures, invalidé table par table ---
+# Chaque table suivie a un compteur de génération (table generations) que des
+# triggers incrémentent à chaque écriture, quelle que soit la connexion :
+# pages, thread d'import, scripts. Un résultat reste servi depuis le cache
+# tant que les générations des tables qu'il lit n'ont pas bougé.
+TABLES_SUIVIES = [
+    "prospects", "clients", "commandes", "taches", "historique_statuts",
+    "checklists", "checklist_items", "checklist_templates", "checklist_template_items",
+]
+TAILLE_CACHE = 256
+
+_entrees = OrderedDict()
+_verrou = threading.Lock()
+
+
+def generations(conn, tables):
+    """Générations courantes des tables, dans l'ordre demandé."""
+    lignes = dict(conn.execute(
+        f"SELECT nom, generation FROM generations WHERE nom IN ({','.join('?' * len(tables))})", tables
+    ).fetchall())
+    return tuple(lignes.get(table) for table in tables)
+
+
+def memoiser(cle, tables, calcul, conn=None):
+    """Résultat de calcul() mis en cache sous `cle`, invalidé comme lire().
+
+    Pour les valeurs dérivées de plusieurs lectures (expansions, agrégats
+    Python) ; la valeur mise en cache est partagée, l'appelant la copie
+    s'il doit la modifier.
+    """
+    conn = conn or get_connection()
+    tables = tuple(tables)
+    # Générations lues avant le calcul : une écriture concurrente invalide au pire trop tôt
+    courantes = generations(conn, tables)
+    cle = (cle, tables)
+    with _verrou:
+        entree = _entrees.get(cle)
+        if entree is not None and entree[0] == courantes:
+            _entrees.move_to_end(cle)
+            return entree[1]
+    valeur = calcul()
+    with _verrou:
+        _entrees[cle] = (courantes, valeur)
+        _entrees.move_to_end(cle)
+        while len(_entrees) > TAILLE_CACHE:
+            _entrees.popitem(last=False)
+    return valeur
+
+
+def lire(sql, params=(), tables=(), conn=None):
+    """pd.read_sql_query mis en cache selon (requête, paramètres).
+
+    tables : tables lues par la requête ; toute écriture dans l'une d'elles
+    invalide le résultat. Renvoie une copie, que l'appelant peut modifier.
+    """
+    conn = conn or get_connection()
+    params = tuple(params)
+    return memoiser(
+        (sql, params), tables, lambda: pd.read_sql_query(sql, conn, params=params), conn
+    ).copy()
@@ -0,0 +1,171 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from db import get_connection, horodatage
+
+# --- Index des créneaux occupés (conflits et créneaux libres) ---
+# Les tâches qui finissent après MARGE_JOURS dans le passé sont rangées par
+# début (liste triée de (début, tache_id)), avec la liste triée de leurs
+# durées. Les tâches chevauchant [debut, fin) commencent forcément entre
+# debut - plus longue durée et fin : deux bisections bornent la recherche.
+# L'index est construit une fois par processus, puis tenu à jour tâche par
+# tâche (insort / retrait) à partir de taches_journal, que des triggers
+# remplissent à chaque écriture dans taches. Une tâche très longue élargit
+# la fenêtre parcourue pour toutes les recherches.
+HEURES_OUVRABLES = (8, 19)
+JOURS_OUVRES = 5               # du lundi au vendredi
+DUREE_PAR_DEFAUT = timedelta(minutes=30)  # tâches sans date_fin (rappels)
+PAS_CRENEAU = 15               # minutes : les propositions tombent sur le quart d'heure
+HORIZON_JOURS = 60
+MARGE_JOURS = 30               # tâches terminées depuis plus longtemps : hors index
+
+_index = {}
+_verrou = threading.RLock()
+
+
+def _lire_date(valeur):
+    """Horodatage stocké -> datetime (None si absent ou illisible)."""
+    if valeur is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(valeur))
+    except ValueError:
+        # Formats hérités que fromisoformat ne lit pas : pandas en dernier recours
+        date = pd.to_datetime(valeur, errors="coerce")
+        return None if pd.isna(date) else date.to_pydatetime()
+
+
+def _intervalle(date_debut, date_fin):
+    """(début, fin) d'une tâche ; une fin absente ou antérieure vaut DUREE_PAR_DEFAUT."""
+    debut = _lire_date(date_debut)
+    if debut is None:
+        return None
+    fin = _lire_date(date_fin)
+    return debut, fin if fin is not None and fin > debut else debut + DUREE_PAR_DEFAUT
+
+
+def _ajouter(tache_id, titre, date_debut, date_fin):
+    intervalle = _intervalle(date_debut, date_fin)
+    if intervalle is None or intervalle[1] < _index["limite"]:
+        return
+    debut, fin = intervalle
+    _index["taches"][tache_id] = (debut, fin, titre)
+    insort(_index["debuts"], (debut, tache_id))
+    insort(_index["durees"], fin - debut)
+
+
+def _retirer(tache_id):
+    tache = _index["taches"].pop(tache_id, None)
+    if tache is None:
+        return
+    debut, fin, _ = tache
+    del _index["debuts"][bisect_left(_index["debuts"], (debut, tache_id))]
+    del _index["durees"][bisect_left(_index["durees"], fin - debut)]
+
+
+def _construire_index(conn):
+    limite = datetime.now() - timedelta(days=MARGE_JOURS)
+    # seq lu avant les tâches : une écriture entre les deux sera simplement rejouée
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM taches_journal").fetchone()[0]
+    lignes = conn.execute(
+        "SELECT tache_id, titre, date_debut, date_fin FROM taches "
+        "WHERE date_debut IS NOT NULL AND MAX(COALESCE(date_fin, date_debut), date_debut) >= ?",
+        (horodatage(limite),)
+    ).fetchall()
+    _index.clear()
+    _index.update({"seq": seq, "limite": limite, "taches": {}, "debuts": [], "durees": []})
+    for ligne in lignes:
+        _ajouter(*ligne)
+
+
+def _mettre_a_jour(conn):
+    """Applique à l'index les tâches journalisées depuis sa dernière mise à jour."""
+    lignes = conn.execute("""
+        SELECT j.seq, j.tache_id, t.tache_id, t.titre, t.date_debut, t.date_fin
+        FROM taches_journal j LEFT JOIN taches t ON t.tache_id = j.tache_id
+        WHERE j.seq > ? ORDER BY j.seq
+    """, (_index["seq"],)).fetchall()
+    for seq, tache_id, existe, titre, date_debut, date_fin in lignes:
+        _retirer(tache_id)
+        if existe is not None:
+            _ajouter(tache_id, titre, date_debut, date_fin)
+        _index["seq"] = seq
+
+
+def index_taches(conn=None):
+    """Index des tâches planifiées du processus, à jour des dernières écritures."""
+    conn = conn or get_connection()
+    with _verrou:
+        if not _index:
+            _construire_index(conn)
+        else:
+            _mettre_a_jour(conn)
+        return _index
+
+
+def conflits(index, debut, fin, ignorer=None):
+    """Tâches chevauchant [debut, fin) : liste de (tache_id, titre, debut, fin).
+
+    ignorer : tache_id à ne pas compter (tâche en cours de modification).
+    """
+    with _verrou:
+        if not index["debuts"]:
+            return []
+        premier = bisect_left(index["debuts"], (debut - index["durees"][-1],))
+        dernier = bisect_left(index["debuts"], (fin,))
+        trouves = []
+        for tache_debut, tache_id in index["debuts"][premier:dernier]:
+            _, tache_fin, titre = index["taches"][tache_id]
+            if tache_fin > debut and tache_id != ignorer:
+                trouves.append((tache_id, titre, tache_debut, tache_fin))
+        return trouves
+
+
+def _arrondir(moment):
+    """Quart d'heure suivant (ou moment lui-même s'il tombe juste)."""
+    moment = moment.replace(second=0, microsecond=0)
+    reste = moment.minute % PAS_CRENEAU
+    return moment + timedelta(minutes=PAS_CRENEAU - reste) if reste else moment
+
+
+def creneaux_libres(index, a_partir_de, duree, nombre=5, ignorer=None, plage=HEURES_OUVRABLES):
+    """Les `nombre` prochains débuts libres de `duree`, en heures et jours ouvrés."""
+    libres = []
+    moment = _arrondir(a_partir_de)
+    limite = a_partir_de + timedelta(days=HORIZON_JOURS)
+    while len(libres) < nombre and moment < limite:
+        ouverture = datetime.combine(moment.date(), time(plage[0]))
+        fermeture = datetime.combine(moment.date(), time(plage[1]))
+        if moment.weekday() >= JOURS_OUVRES or moment + duree > fermeture:
+            moment = ouverture + timedelta(days=1)
+            continue
+        moment = max(moment, ouverture)
+        occupe = conflits(index, moment, moment + duree, ignorer)
+        if occupe:
+            moment = _arrondir(max(f for _, _, _, f in occupe))
+        else:
+            libres.append(moment)
+            moment += duree
+    return libres
+
+
+def controler_creneau(debut, fin, ignorer=None, forcer=False):
+    """Vérifie le créneau d'un formulaire ; affiche conflits et propositions.
+
+    Renvoie True si l'enregistrement peut avoir lieu (créneau libre ou forcé).
+    """
+    index = index_taches()
+    occupe = conflits(index, debut, fin, ignorer)
+    if not occupe:
+        return True
+    st.error("Créneau déjà occupé : " + ", ".join(
+        f"{titre} ({d.strftime('%d/%m %H:%M')}-{f.strftime('%H:%M')})" for _, titre, d, f in occupe
+    ))
+    libres = creneaux_libres(index, debut, fin - debut, ignorer=ignorer)
+    if libres:
+        st.info("Prochains créneaux libres : " + ", ".join(m.strftime("%a %d/%m %H:%M") for m in libres))
+    return forcer
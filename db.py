@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+from datetime import datetime, time, timedelta
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# --- Accès centralisé à la base SQLite ---
+DB_PATH = "crm_data.db"
+
+# Réglages appliqués à chaque nouvelle connexion
+PRAGMAS = {
+    "journal_mode": "WAL",       # lecteurs et écrivain ne se bloquent plus
+    "synchronous": "NORMAL",     # sûr en WAL, beaucoup moins de fsync
+    "busy_timeout": 5000,        # attend 5 s au lieu de lever "database is locked"
+    "cache_size": -20000,        # ~20 Mo de cache de pages
+    "mmap_size": 268435456,      # 256 Mo de lecture en mmap
+    "temp_store": "MEMORY",
+}
+
+# Format unique des horodatages stockés : l'ordre du texte est l'ordre
+# chronologique, les plages de dates peuvent donc utiliser les index
+FORMAT_HORODATAGE = "%Y-%m-%d %H:%M:%S"
+
+_SESSION_KEY = "_db_conn"
+_local = threading.local()
+
+
+def connect(path=DB_PATH):
+    """Ouvre une nouvelle connexion configurée (threads de fond, scripts)."""
+    conn = sqlite3.connect(path, timeout=PRAGMAS["busy_timeout"] / 1000, check_same_thread=False)
+    for pragma, valeur in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={valeur}")
+    return conn
+
+
+def get_connection():
+    """Connexion partagée de la session Streamlit, ouverte une seule fois.
+
+    Les reruns d'une même session s'exécutent l'un après l'autre mais pas
+    toujours dans le même thread, d'où check_same_thread=False. Hors
+    Streamlit (scripts, tests), une connexion par thread est conservée.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        if getattr(_local, "conn", None) is None:
+            _local.conn = connect()
+        return _local.conn
+    conn = st.session_state.get(_SESSION_KEY)
+    if conn is None:
+        conn = connect()
+        st.session_state[_SESSION_KEY] = conn
+    return conn
+
+
+def horodatage(valeur):
+    """datetime ou date -> texte stocké en base (une date vaut minuit)."""
+    if valeur is None:
+        return None
+    if not isinstance(valeur, datetime):
+        valeur = datetime.combine(valeur, time())
+    return valeur.strftime(FORMAT_HORODATAGE)
+
+
+def bornes_jours(premier, dernier):
+    """Plage semi-ouverte [premier jour 00:00, lendemain du dernier 00:00) pour `>= ? AND < ?`."""
+    premier = premier.date() if isinstance(premier, datetime) else premier
+    dernier = dernier.date() if isinstance(dernier, datetime) else dernier
+    return horodatage(premier), horodatage(dernier + timedelta(days=1))
@@ -0,0 +1,91 @@
+import time
+
+import streamlit as st
+
+from db import get_connection
+
+# --- Écritures groupées des cases à cocher ---
+# Cocher « Livré », « Devis envoyé » ou un item de checklist n'écrit plus
+# rien tout de suite : le changement rejoint un tampon en session, vidé en
+# une seule transaction (executemany) sur demande ou après DELAI secondes
+# sans nouveau clic. Les cases gardent la valeur cochée entre-temps.
+DELAI = 3  # secondes
+
+# type d'écriture -> requête (valeur, identifiant)
+REQUETES = {
+    "livre": "UPDATE commandes SET statut=? WHERE commande_id=?",
+    "devis": "UPDATE commandes SET devis_envoye=? WHERE commande_id=?",
+    "checklist_item": "UPDATE checklist_items SET fait=? WHERE id=?",
+}
+
+_CLE = "_ecritures_en_attente"
+_CLE_DERNIER = "_ecritures_dernier_clic"
+_CLE_PAGE = "_ecritures_page"
+
+
+def en_attente():
+    """Tampon de la session : {(type, identifiant): valeur}."""
+    return st.session_state.setdefault(_CLE, {})
+
+
+def differer(type_ecriture, identifiant, valeur):
+    """Ajoute (ou remplace) une écriture dans le tampon."""
+    en_attente()[(type_ecriture, identifiant)] = valeur
+    st.session_state[_CLE_DERNIER] = time.monotonic()
+
+
+def case_cochee(type_ecriture, identifiant, cle, coche=1, decoche=0):
+    """Rappel on_change d'une case : diffère l'écriture de sa nouvelle valeur."""
+    differer(type_ecriture, identifiant, coche if st.session_state[cle] else decoche)
+
+
+def vider(conn=None):
+    """Écrit tout le tampon en une transaction ; renvoie le nombre de lignes écrites."""
+    tampon = en_attente()
+    if not tampon:
+        return 0
+    par_type = {}
+    for (type_ecriture, identifiant), valeur in tampon.items():
+        par_type.setdefault(type_ecriture, []).append((valeur, identifiant))
+    conn = conn or get_connection()
+    with conn:
+        for type_ecriture, lignes in par_type.items():
+            conn.executemany(REQUETES[type_ecriture], lignes)
+    tampon.clear()
+    return sum(len(lignes) for lignes in par_type.values())
+
+
+def vider_si_inactif(page=None):
+    """Vide le tampon si aucun clic depuis DELAI secondes, ou sans attendre si
+    la page affichée a changé ; renvoie le nombre de lignes écrites."""
+    if page is not None:
+        page_quittee = st.session_state.get(_CLE_PAGE, page) != page
+        st.session_state[_CLE_PAGE] = page
+        if page_quittee:
+            return vider()
+    if en_attente() and time.monotonic() - st.session_state.get(_CLE_DERNIER, 0) >= DELAI:
+        return vider()
+    return 0
+
+
+@st.fragment(run_every=f"{DELAI}s")
+def _barre_differee():
+    if vider_si_inactif():
+        st.rerun()  # toute la page, pour les statuts et totaux qui dépendent des cases
+    nombre = len(en_attente())
+    if nombre:
+        col1, col2 = st.columns([3, 1])
+        col1.caption(f"{nombre} modification(s) en attente d'enregistrement")
+        if col2.button("Enregistrer maintenant", key="vider_ecritures"):
+            vider()
+            st.rerun()
+
+
+def barre_ecritures():
+    """Nombre de changements en attente, bouton d'enregistrement et vidage différé.
+
+    Le fragment rafraîchi toutes les DELAI secondes n'est affiché que tant
+    que le tampon contient des écritures.
+    """
+    if en_attente():
+        _barre_differee()
@@ -0,0 +1,60 @@
+from cache import memoiser
+from db import get_connection
+
+# --- Fiches : lecture d'un seul enregistrement pour les panneaux de détail ---
+# Chaque fiche est une requête ponctuelle sur une clé primaire ou un index
+# (client_id, place_id, idx_commandes_client), gardée dans le cache de
+# lecture jusqu'à la prochaine écriture dans les tables lues. Les lignes
+# sont des dicts : une valeur absente en base vaut None.
+
+# Champs du prospect d'origine affichés sur la fiche d'un client
+CHAMPS_PROSPECT = ["main_category", "website", "emails", "link", "reviews", "rating"]
+
+
+def _lignes(conn, sql, params):
+    curseur = conn.execute(sql, params)
+    colonnes = [d[0] for d in curseur.description]
+    return [dict(zip(colonnes, ligne)) for ligne in curseur.fetchall()]
+
+
+def _fiche(cle, tables, sql, params):
+    conn = get_connection()
+    # Identifiants venant de pandas (numpy.int64) : sqlite3 les lierait comme des blobs
+    params = tuple(p.item() if hasattr(p, "item") else p for p in params)
+    lignes = memoiser(cle, tables, lambda: _lignes(conn, sql, params), conn)
+    # Copies : l'appelant peut modifier sa fiche sans toucher au cache
+    return [dict(ligne) for ligne in lignes]
+
+
+def fiche_client(client_id):
+    """Client et champs de son prospect d'origine (None si inconnu)."""
+    champs = ", ".join(f"p.{champ}" for champ in CHAMPS_PROSPECT)
+    lignes = _fiche(
+        ("fiche_client", client_id), ["clients", "prospects"],
+        f"SELECT cl.*, {champs} FROM clients cl LEFT JOIN prospects p ON p.place_id = cl.place_id WHERE cl.client_id = ?",
+        (client_id,)
+    )
+    return lignes[0] if lignes else None
+
+
+def fiche_prospect(place_id):
+    """Fiche complète d'un prospect (None si inconnu)."""
+    lignes = _fiche(
+        ("fiche_prospect", place_id), ["prospects"],
+        "SELECT * FROM prospects WHERE place_id = ?", (place_id,)
+    )
+    return lignes[0] if lignes else None
+
+
+def commandes_client(client_id):
+    """Commandes d'un client, des plus anciennes aux plus récentes."""
+    return _fiche(
+        ("commandes_client", client_id), ["commandes"],
+        "SELECT * FROM commandes WHERE client_id = ? ORDER BY date_debut", (client_id,)
+    )
+
+
+def fiche_tache(tache_id):
+    """Une tâche (None si inconnue)."""
+    lignes = _fiche(("fiche_tache", tache_id), ["taches"], "SELECT * FROM taches WHERE tache_id = ?", (tache_id,))
+    return lignes[0] if lignes else None
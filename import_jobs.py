@@ -0,0 +1,138 @@
+import csv
+import os
+import sqlite3
+import threading
+import traceback
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from db import connect
+from import_prospects import importer_prospects
+
+# --- Imports CSV en tâche de fond ---
+# Le fichier reçu est copié dans IMPORTS_DIR puis traité par un thread unique
+# (un par processus), morceau par morceau. L'avancement est inscrit dans la
+# table import_jobs après chaque morceau : si le serveur redémarre, le job
+# reprend au premier morceau non terminé. Rejouer un morceau à moitié écrit
+# est sans risque, l'import étant un upsert qui saute les lignes inchangées.
+IMPORTS_DIR = "imports"
+TAILLE_MORCEAU = 2000
+STATUTS_ACTIFS = ("en attente", "en cours")
+
+_reveil = threading.Event()
+
+
+def compter_lignes(chemin):
+    """Nombre d'enregistrements du CSV (hors en-tête), champs multi-lignes compris."""
+    with open(chemin, newline="", encoding="utf-8", errors="replace") as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def soumettre_import(conn, nom_fichier, contenu):
+    """Enregistre le fichier et crée le job ; renvoie son identifiant."""
+    os.makedirs(IMPORTS_DIR, exist_ok=True)
+    chemin = os.path.join(IMPORTS_DIR, f"{uuid.uuid4().hex}.csv")
+    with open(chemin, "wb") as f:
+        f.write(contenu)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO import_jobs (nom_fichier, chemin, statut, date_creation, date_maj)
+            VALUES (?, ?, 'en attente', ?, ?)
+        """, (nom_fichier, chemin, now, now))
+        job_id = c.lastrowid
+    demarrer_worker()
+    _reveil.set()
+    return job_id
+
+
+def lister_jobs(conn, limite=5):
+    """Derniers jobs, du plus récent au plus ancien."""
+    return pd.read_sql_query("SELECT * FROM import_jobs ORDER BY job_id DESC LIMIT ?", conn, params=(limite,))
+
+
+def rejets_job(conn, job_id, limite=-1):
+    """Lignes rejetées d'un job, dans l'ordre du fichier (toutes par défaut)."""
+    return conn.execute(
+        "SELECT ligne, raison FROM import_rejets WHERE job_id=? ORDER BY ligne LIMIT ?", (job_id, limite)
+    ).fetchall()
+
+
+def _maj_job(c, job_id, **champs):
+    champs["date_maj"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    c.execute(
+        f"UPDATE import_jobs SET {', '.join(f'{col}=?' for col in champs)} WHERE job_id=?",
+        (*champs.values(), job_id)
+    )
+
+
+def _supprimer_fichier(chemin):
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+
+def _traiter_job(conn, job):
+    job_id = job["job_id"]
+    lignes_total = job["lignes_total"]
+    if lignes_total is None:
+        lignes_total = compter_lignes(job["chemin"])
+    with conn:
+        _maj_job(conn, job_id, statut="en cours", lignes_total=lignes_total)
+    morceaux = pd.read_csv(job["chemin"], chunksize=TAILLE_MORCEAU, dtype={"phone": str})
+    for numero, morceau in enumerate(morceaux):
+        if numero < job["morceaux_termines"]:
+            continue
+        rapport = importer_prospects(morceau, conn, premiere_ligne=2 + numero * TAILLE_MORCEAU)
+        # Avancement et rejets du morceau enregistrés ensemble : c'est le point de reprise
+        with conn:
+            conn.executemany(
+                "INSERT INTO import_rejets (job_id, ligne, raison) VALUES (?, ?, ?)",
+                [(job_id, ligne, raison) for ligne, raison in rapport["rejetes"]]
+            )
+            conn.execute("""
+                UPDATE import_jobs SET
+                    morceaux_termines = ?, lignes_traitees = lignes_traitees + ?,
+                    inseres = inseres + ?, mis_a_jour = mis_a_jour + ?,
+                    inchanges = inchanges + ?, rejetes = rejetes + ?
+                WHERE job_id = ?
+            """, (numero + 1, len(morceau), rapport["inseres"], rapport["mis_a_jour"],
+                  rapport["inchanges"], len(rapport["rejetes"]), job_id))
+    with conn:
+        _maj_job(conn, job_id, statut="terminé", lignes_traitees=lignes_total)
+    _supprimer_fichier(job["chemin"])
+
+
+def _boucle_worker():
+    conn = connect()
+    while True:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        job = c.execute(
+            f"SELECT * FROM import_jobs WHERE statut IN ({','.join('?' * len(STATUTS_ACTIFS))}) ORDER BY job_id LIMIT 1",
+            STATUTS_ACTIFS
+        ).fetchone()
+        if job is None:
+            _reveil.wait(timeout=30)
+            _reveil.clear()
+            continue
+        try:
+            _traiter_job(conn, job)
+        except Exception as e:
+            with conn:
+                _maj_job(conn, job["job_id"], statut="erreur", erreur=f"{e}\n{traceback.format_exc()}")
+            # Un job en erreur n'est jamais repris : son fichier ne servirait plus
+            _supprimer_fichier(job["chemin"])
+
+
+@st.cache_resource
+def demarrer_worker():
+    """Démarre le thread d'import une seule fois par processus (et reprend les jobs interrompus)."""
+    worker = threading.Thread(target=_boucle_worker, name="import-prospects", daemon=True)
+    worker.start()
+    return worker
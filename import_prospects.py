@@ -0,0 +1,166 @@
+import hashlib
+import sqlite3
+
+import pandas as pd
+
+from db import get_connection
+from telephones import normaliser_telephones
+
+# --- Import des prospects depuis un CSV (scrapes Google Maps) ---
+COLONNES_PROSPECT = [
+    "place_id", "name", "website", "phone", "emails", "main_category", "categories", "reviews",
+    "rating", "address", "horaires", "link", "featured_reviews", "is_spending_on_ads", "query",
+]
+# Colonnes stockées en texte brut, même si pandas les a lues autrement
+COLONNES_TEXTE = ["place_id", "name", "address", "categories", "featured_reviews", "is_spending_on_ads"]
+VALEURS_PAR_DEFAUT = {"reviews": 0, "rating": 0}
+TAILLE_LOT = 500
+
+# Le hash du contenu importé permet de sauter les lignes inchangées lors d'un ré-import
+COLONNES_UPSERT = COLONNES_PROSPECT + ["hash_contenu"]
+_colonnes_maj = [col for col in COLONNES_UPSERT if col != "phone"]
+UPSERT_PROSPECT = f"""
+    INSERT INTO prospects ({", ".join(COLONNES_UPSERT)})
+    VALUES ({", ".join("?" for _ in COLONNES_UPSERT)})
+    ON CONFLICT(phone) DO UPDATE SET {", ".join(f"{col}=excluded.{col}" for col in _colonnes_maj)}
+    ON CONFLICT(place_id) DO UPDATE SET {", ".join(f"{col}=excluded.{col}" for col in COLONNES_UPSERT)}
+"""
+
+
+def valider_prospects(df, premiere_ligne=2):
+    """Valide toutes les lignes d'un coup.
+
+    Renvoie le DataFrame des lignes valides (colonnes de la table, téléphone
+    normalisé) et la liste des rejets sous forme de (numéro de ligne, raison).
+    premiere_ligne est le numéro de la première ligne du DataFrame dans le
+    fichier (2 par défaut, l'en-tête étant la ligne 1).
+    """
+    df = df.reindex(columns=COLONNES_PROSPECT)
+    df.index = pd.RangeIndex(premiere_ligne, premiere_ligne + len(df))
+    for col in COLONNES_TEXTE:
+        df[col] = df[col].fillna("").astype(str).str.strip()
+    tel, mobile = normaliser_telephones(df["phone"])
+    rejets = []
+
+    for ligne, numero in df.loc[~mobile, "phone"].fillna("").items():
+        rejets.append((ligne, f"numéro non mobile FR (06, 07, +336, +337). Numéro: {numero}"))
+
+    complet = (df["name"] != "") & (df["address"] != "")
+    for ligne in df.index[mobile & ~complet]:
+        rejets.append((ligne, "nom/téléphone/adresse manquant."))
+
+    # Sans place_id, l'upsert écraserait le dernier prospect sans identifiant
+    identifie = df["place_id"] != ""
+    for ligne in df.index[mobile & complet & ~identifie]:
+        rejets.append((ligne, "place_id manquant."))
+
+    valides = df[mobile & complet & identifie].copy()
+    valides["phone"] = tel[mobile & complet & identifie]
+
+    # Même téléphone ou même place_id plusieurs fois dans le fichier : la dernière ligne l'emporte
+    doublons = valides["phone"].duplicated(keep="last")
+    for ligne, numero in valides.loc[doublons, "phone"].items():
+        rejets.append((ligne, f"téléphone en double dans le fichier, remplacé par une ligne suivante. Numéro: {numero}"))
+    valides = valides[~doublons]
+    doublons = valides["place_id"].duplicated(keep="last")
+    for ligne, place_id in valides.loc[doublons, "place_id"].items():
+        rejets.append((ligne, f"place_id en double dans le fichier, remplacé par une ligne suivante. place_id: {place_id}"))
+    valides = valides[~doublons]
+
+    valides = valides.fillna(VALEURS_PAR_DEFAUT)
+    valides["hash_contenu"] = hash_contenu(valides)
+    return valides, sorted(rejets)
+
+
+# Format des colonnes numériques dans l'empreinte : indépendant du type que
+# pandas a déduit du morceau lu (12 et 12.0 donnent le même texte)
+FORMATS_HASH = {"reviews": "{:.0f}", "rating": "{:.2f}"}
+
+
+def _texte_canonique(serie, col):
+    if col in FORMATS_HASH:
+        nombres = pd.to_numeric(serie, errors="coerce")
+        return ["" if pd.isna(x) else FORMATS_HASH[col].format(x) for x in nombres]
+    return serie.fillna("").astype(str).tolist()
+
+
+def hash_contenu(df):
+    """Empreinte stable de chaque ligne sur les colonnes importées (texte hexadécimal)."""
+    colonnes = [_texte_canonique(df[col], col) for col in COLONNES_PROSPECT]
+    return [
+        hashlib.blake2b("\x1f".join(valeurs).encode(), digest_size=8).hexdigest()
+        for valeurs in zip(*colonnes)
+    ]
+
+
+def _enregistrements(lot):
+    """Tuples prêts pour executemany (types Python natifs, NaN -> NULL)."""
+    lot = lot.astype(object).where(lot.notna(), None)
+    return list(lot.itertuples(index=False, name=None))
+
+
+def _existants(c, phones, place_ids, hashes):
+    """Pour chaque ligne du lot : (existe déjà, contenu inchangé)."""
+    trouves = c.execute(
+        f"SELECT phone, place_id, hash_contenu FROM prospects WHERE phone IN ({','.join('?' * len(phones))}) "
+        f"OR place_id IN ({','.join('?' * len(place_ids))})",
+        phones + place_ids
+    ).fetchall()
+    hash_par_phone = {phone: hash_ for phone, _, hash_ in trouves}
+    place_ids_connus = {place_id for _, place_id, _ in trouves}
+    return [
+        (phone in hash_par_phone or place_id in place_ids_connus, hash_par_phone.get(phone) == hash_)
+        for phone, place_id, hash_ in zip(phones, place_ids, hashes)
+    ]
+
+
+def importer_prospects(df, conn=None, taille_lot=TAILLE_LOT, premiere_ligne=2):
+    """Importe un DataFrame de prospects par lots transactionnels.
+
+    Les lignes dont le hash de contenu est identique à celui déjà stocké
+    sont sautées. Les autres sont écrites avec un seul executemany par lot,
+    en upsert sur le téléphone. Si un lot échoue (conflit inattendu), il
+    est rejoué ligne par ligne pour isoler les lignes fautives. Renvoie :
+    {"inseres": int, "mis_a_jour": int, "inchanges": int, "rejetes": [(ligne, raison), ...]}.
+    """
+    conn = conn or get_connection()
+    valides, rejets = valider_prospects(df, premiere_ligne)
+    rapport = {"inseres": 0, "mis_a_jour": 0, "inchanges": 0, "rejetes": rejets}
+    enregistrements = _enregistrements(valides[COLONNES_UPSERT])
+    lignes = valides.index.tolist()
+    phones = valides["phone"].tolist()
+    place_ids = valides["place_id"].tolist()
+    hashes = valides["hash_contenu"].tolist()
+    c = conn.cursor()
+    for debut in range(0, len(valides), taille_lot):
+        fin = debut + taille_lot
+        lot = [
+            (ligne, existe, enregistrement)
+            for ligne, (existe, inchange), enregistrement in zip(
+                lignes[debut:fin], _existants(c, phones[debut:fin], place_ids[debut:fin], hashes[debut:fin]),
+                enregistrements[debut:fin]
+            )
+            if not inchange
+        ]
+        rapport["inchanges"] += len(lignes[debut:fin]) - len(lot)
+        if not lot:
+            continue
+        try:
+            with conn:
+                # Bilan tiré des lignes réellement créées, pas de la taille du lot
+                c.execute("BEGIN")
+                avant = c.execute("SELECT COUNT(*) FROM prospects").fetchone()[0]
+                c.executemany(UPSERT_PROSPECT, [enregistrement for _, _, enregistrement in lot])
+                nb_inseres = c.execute("SELECT COUNT(*) FROM prospects").fetchone()[0] - avant
+            rapport["inseres"] += nb_inseres
+            rapport["mis_a_jour"] += len(lot) - nb_inseres
+        except sqlite3.IntegrityError:
+            for ligne, existe, enregistrement in lot:
+                try:
+                    with conn:
+                        c.execute(UPSERT_PROSPECT, enregistrement)
+                    rapport["mis_a_jour" if existe else "inseres"] += 1
+                except sqlite3.IntegrityError as e:
+                    rapport["rejetes"].append((ligne, f"conflit avec un prospect existant ({e})."))
+    rapport["rejetes"].sort()
+    return rapport
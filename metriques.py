@@ -0,0 +1,149 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from db import connect
+
+# --- Indicateurs quotidiens (table daily_stats) ---
+# Chaque métrique est une somme par jour, tenue à jour par des triggers sur
+# la table source (voir migrations.py) : les écrans lisent quelques lignes
+# pré-agrégées au lieu de parcourir l'historique. Si la table est vidée ou
+# qu'une définition change, `python metriques.py` la reconstruit.
+
+# métrique -> (table, colonne de date, condition, valeur sommée)
+# {r} désigne la ligne : new/old dans les triggers, la table au recalcul.
+METRIQUES = {
+    "appels": ("taches", "date_debut", "{r}.type_tache = 'tache'", "1"),
+    "rdv": ("taches", "date_debut", "{r}.type_tache = 'r1'", "1"),
+    "missions": ("taches", "date_debut", "{r}.statut = 'terminé'", "1"),
+    "heures": ("taches", "date_debut", "1", "COALESCE({r}.temps_passe, 0)"),
+    "r1_termines": ("taches", "date_debut", "{r}.type_tache = 'r1' AND {r}.statut = 'terminé'", "1"),
+    "a_rappeller": ("taches", "date_debut", "{r}.type_tache = 'à rappeller'", "1"),
+    "refus": ("taches", "date_debut", "{r}.type_tache = 'pas intérréssé'", "1"),
+    "taches_appel": ("taches", "date_debut", "COALESCE({r}.type_tache, '') NOT IN ('', 'n''a pas répondu')", "1"),
+    "facture": ("commandes", "date_debut", "1", "COALESCE({r}.prix, 0)"),
+    "encaisse": ("commandes", "date_debut", "1", "COALESCE({r}.argent_encaisse, 0)"),
+    "missions_validees": ("commandes", "date_fin", "{r}.statut = 'validé'", "1"),
+    "nouveaux_clients": ("clients", "date_conversion", "1", "1"),
+    "changements_statut": ("historique_statuts", "date_changement", "1", "1"),
+}
+
+_AJOUT = """
+    INSERT INTO daily_stats (jour, metrique, valeur)
+    SELECT date({r}.{colonne}), '{nom}', {signe}{valeur} WHERE {condition} AND date({r}.{colonne}) IS NOT NULL
+    ON CONFLICT(jour, metrique) DO UPDATE SET valeur = valeur + excluded.valeur;"""
+
+
+def _instructions(table, r, signe):
+    return "".join(
+        _AJOUT.format(r=r, colonne=colonne, nom=nom, signe=signe,
+                      valeur=valeur.format(r=r), condition=condition.format(r=r))
+        for nom, (t, colonne, condition, valeur) in METRIQUES.items() if t == table
+    )
+
+
+def triggers_stats():
+    """Instructions (re)créant les triggers qui tiennent daily_stats à jour."""
+    instructions = []
+    for table in dict.fromkeys(t for t, _, _, _ in METRIQUES.values()):
+        ajout, retrait = _instructions(table, "new", ""), _instructions(table, "old", "-")
+        instructions += [
+            f"DROP TRIGGER IF EXISTS {table}_stats_ai",
+            f"DROP TRIGGER IF EXISTS {table}_stats_ad",
+            f"DROP TRIGGER IF EXISTS {table}_stats_au",
+            f"CREATE TRIGGER {table}_stats_ai AFTER INSERT ON {table} BEGIN{ajout}\nEND",
+            f"CREATE TRIGGER {table}_stats_ad AFTER DELETE ON {table} BEGIN{retrait}\nEND",
+            f"CREATE TRIGGER {table}_stats_au AFTER UPDATE ON {table} BEGIN{retrait}{ajout}\nEND",
+        ]
+    return instructions
+
+
+def reconstruire_stats(c):
+    """Recalcule daily_stats depuis tout l'historique (curseur fourni, sans commit)."""
+    c.execute("DELETE FROM daily_stats")
+    for nom, (table, colonne, condition, valeur) in METRIQUES.items():
+        c.execute(f"""
+            INSERT INTO daily_stats (jour, metrique, valeur)
+            SELECT date({colonne}), ?, SUM({valeur.format(r=table)}) FROM {table}
+            WHERE {condition.format(r=table)} AND date({colonne}) IS NOT NULL
+            GROUP BY date({colonne})
+        """, (nom,))
+
+
+def stats_periodes(conn, metriques, bornes):
+    """Sommes de daily_stats par période, au format long : metrique, periode, valeur.
+
+    bornes : {periode: (premier jour, dernier jour)}, bornes incluses.
+    """
+    selections, params = [], []
+    for debut, fin in bornes.values():
+        selections.append("COALESCE(SUM(CASE WHEN jour BETWEEN ? AND ? THEN valeur END), 0)")
+        params += [debut.isoformat(), fin.isoformat()]
+    debut_fenetre = min(debut for debut, _ in bornes.values())
+    fin_fenetre = max(fin for _, fin in bornes.values())
+    lignes = conn.execute(f"""
+        SELECT metrique, {", ".join(selections)} FROM daily_stats
+        WHERE jour BETWEEN ? AND ? AND metrique IN ({",".join("?" * len(metriques))})
+        GROUP BY metrique
+    """, params + [debut_fenetre.isoformat(), fin_fenetre.isoformat()] + list(metriques)).fetchall()
+    sommes = {metrique: valeurs for metrique, *valeurs in lignes}
+    return pd.DataFrame(
+        [(nom, periode, sommes.get(nom, [0] * len(bornes))[i])
+         for nom in metriques for i, periode in enumerate(bornes)],
+        columns=["metrique", "periode", "valeur"], dtype=object
+    )
+
+
+def stats_jour(conn, jour, metriques):
+    """Valeurs d'un seul jour : {metrique: valeur} (0 si absente)."""
+    df = stats_periodes(conn, metriques, {"jour": (jour, jour)})
+    return dict(zip(df["metrique"], df["valeur"]))
+
+
+# --- Indicateurs du Dashboard ---
+METRIQUES_DASHBOARD = ["appels", "rdv", "missions", "heures", "facture", "encaisse", "nouveaux_clients"]
+
+
+def periodes(jour):
+    """Périodes du Dashboard : {nom: (premier jour, dernier jour)} inclus."""
+    lundi = jour - timedelta(days=jour.weekday())
+    return {
+        "aujourdhui": (jour, jour),
+        "hier": (jour - timedelta(days=1), jour - timedelta(days=1)),
+        "meme_jour_s1": (jour - timedelta(days=7), jour - timedelta(days=7)),
+        "semaine": (lundi, lundi + timedelta(days=6)),
+        "semaine_prec": (lundi - timedelta(days=7), lundi - timedelta(days=1)),
+    }
+
+
+def calculer_metriques(conn, jour):
+    """Toutes les métriques du Dashboard au format long : metrique, periode, valeur."""
+    bornes = periodes(jour)
+    df = stats_periodes(conn, METRIQUES_DASHBOARD, bornes)
+    # Indicateur instantané (pas une somme par jour), servi par idx_commandes_fin_statut
+    retard = conn.execute(
+        "SELECT COUNT(*) FROM commandes WHERE date_fin < ? AND statut != 'livré'", (jour.isoformat(),)
+    ).fetchone()[0]
+    # Métrique dérivée : chiffre facturé par heure travaillée
+    valeurs = df.set_index(["metrique", "periode"])["valeur"]
+    derivees = [("projets_retard", "aujourdhui", retard)] + [
+        ("taux_horaire", periode, round(valeurs["facture", periode] / valeurs["heures", periode], 2)
+         if valeurs["heures", periode] else 0)
+        for periode in bornes
+    ]
+    return pd.concat([df, pd.DataFrame(derivees, columns=df.columns, dtype=object)], ignore_index=True)
+
+
+def tableau(metriques, lignes, colonnes):
+    """Vue métriques x périodes d'une partie du frame long."""
+    vue = metriques[metriques["metrique"].isin(lignes) & metriques["periode"].isin(colonnes)]
+    return vue.pivot(index="metrique", columns="periode", values="valeur").reindex(index=lignes, columns=colonnes)
+
+
+if __name__ == "__main__":
+    conn = connect()
+    with conn:
+        reconstruire_stats(conn.cursor())
+    nb = conn.execute("SELECT COUNT(*) FROM daily_stats").fetchone()[0]
+    conn.close()
+    print(f"daily_stats reconstruite : {nb} lignes.")
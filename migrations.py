@@ -0,0 +1,450 @@
+import pandas as pd
+import streamlit as st
+from datetime import datetime
+
+from db import connect, FORMAT_HORODATAGE
+from telephones import normaliser_telephones, renormaliser_telephones
+from metriques import triggers_stats, reconstruire_stats
+from cache import TABLES_SUIVIES
+
+# --- Migrations du schéma, appliquées une seule fois et dans l'ordre ---
+# Chaque étape reçoit un curseur ; son numéro est inscrit dans schema_version
+# une fois appliquée, elle n'est donc jamais rejouée aux reruns suivants.
+
+
+def _ajouter_colonne(c, table, colonne, definition):
+    colonnes = [col[1] for col in c.execute(f"PRAGMA table_info({table})")]
+    if colonne not in colonnes:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {colonne} {definition}")
+
+
+def _tables_de_base(c):
+    # Table des prospects
+    c.execute('''CREATE TABLE IF NOT EXISTS prospects (
+        place_id TEXT PRIMARY KEY,
+        name TEXT,
+        website TEXT,
+        phone TEXT,
+        emails TEXT,
+        main_category TEXT,
+        categories TEXT,
+        reviews INTEGER,
+        rating REAL,
+        address TEXT,
+        horaires TEXT,
+        link TEXT,
+        featured_reviews TEXT,
+        is_spending_on_ads TEXT,
+        query TEXT,
+        statut_appel TEXT DEFAULT '',
+        date_dernier_appel TEXT DEFAULT '',
+        meta_appel TEXT DEFAULT ''
+    )''')
+    # Table des clients
+    c.execute('''CREATE TABLE IF NOT EXISTS clients (
+        client_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        place_id TEXT,
+        name TEXT,
+        phone TEXT,
+        address TEXT,
+        date_conversion TEXT,
+        last_contact TEXT,
+        FOREIGN KEY(place_id) REFERENCES prospects(place_id)
+    )''')
+    # Table des prestations/commandes
+    c.execute('''CREATE TABLE IF NOT EXISTS commandes (
+        commande_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id INTEGER,
+        nom_service TEXT,
+        prestation TEXT,
+        prix REAL,
+        recurrence TEXT,
+        date_debut TEXT,
+        date_fin TEXT,
+        argent_encaisse REAL,
+        statut TEXT,
+        temps_passe TEXT,
+        FOREIGN KEY(client_id) REFERENCES clients(client_id)
+    )''')
+    # Table historique des statuts
+    c.execute('''CREATE TABLE IF NOT EXISTS historique_statuts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        place_id TEXT,
+        statut TEXT,
+        date_changement TEXT,
+        FOREIGN KEY (place_id) REFERENCES prospects (place_id)
+    )''')
+    # Table des tâches
+    c.execute('''CREATE TABLE IF NOT EXISTS taches (
+        tache_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id INTEGER,
+        commande_id INTEGER,
+        type_tache TEXT,
+        titre TEXT,
+        description TEXT,
+        date_debut DATETIME,
+        date_fin DATETIME,
+        temps_passe FLOAT,
+        statut TEXT DEFAULT 'à faire',
+        est_process BOOLEAN DEFAULT 0,
+        service TEXT,
+        FOREIGN KEY(client_id) REFERENCES clients(client_id),
+        FOREIGN KEY(commande_id) REFERENCES commandes(commande_id)
+    )''')
+    # Anciennes bases créées avant l'ajout de ces colonnes
+    _ajouter_colonne(c, "commandes", "nom_service", "TEXT")
+    _ajouter_colonne(c, "taches", "date_fin", "DATETIME")
+    _ajouter_colonne(c, "taches", "temps_passe", "FLOAT")
+
+
+def _tables_checklists(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS checklist_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT,
+        description TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS checklist_template_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_id INTEGER,
+        texte TEXT,
+        ordre INTEGER,
+        FOREIGN KEY(template_id) REFERENCES checklist_templates(id)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS checklists (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom TEXT,
+        description TEXT,
+        commande_id INTEGER,
+        process_id INTEGER,
+        template_id INTEGER,
+        date_creation TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS checklist_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        checklist_id INTEGER,
+        texte TEXT,
+        fait INTEGER,
+        ordre INTEGER,
+        FOREIGN KEY(checklist_id) REFERENCES checklists(id)
+    )''')
+
+
+def _nom_service_par_defaut(c):
+    # Correctif ponctuel : donner un nom de service par défaut aux commandes qui n'en ont pas
+    c.execute("""
+        UPDATE commandes
+        SET nom_service = 'Service par défaut'
+        WHERE nom_service IS NULL OR nom_service = ''
+    """)
+
+
+def _colonne_devis_envoye(c):
+    _ajouter_colonne(c, "commandes", "devis_envoye", "INTEGER DEFAULT 0")
+
+
+# Colonnes qui désignent un prospect par son place_id
+REFERENCES_PROSPECT = [("historique_statuts", "place_id"), ("clients", "place_id"), ("taches", "service")]
+
+
+def _vide(valeur):
+    return valeur is None or (isinstance(valeur, str) and valeur.strip() == "")
+
+
+def _fusionner_doublons_prospects(c):
+    """Fusionne les prospects dont les numéros sont identiques une fois normalisés.
+
+    Dans chaque groupe on garde la fiche qui porte un statut d'appel (la plus
+    récemment appelée), à défaut la plus ancienne ; ses champs vides sont
+    complétés par les autres fiches, puis l'historique, les clients et les
+    tâches de ces dernières lui sont rattachés avant leur suppression.
+    """
+    curseur = c.execute("SELECT rowid, * FROM prospects")
+    colonnes = [d[0] for d in curseur.description][1:]
+    lignes = pd.DataFrame(curseur.fetchall(), columns=["ordre"] + colonnes, dtype=object)
+    if lignes.empty:
+        return 0
+    lignes["canonique"], _ = normaliser_telephones(lignes["phone"])
+    lignes["a_statut"] = ~lignes["statut_appel"].map(_vide)
+    lignes["appel"] = lignes["date_dernier_appel"].fillna("").astype(str)
+    lignes = lignes[lignes["canonique"] != ""].sort_values(
+        ["a_statut", "appel", "ordre"], ascending=[False, False, True]
+    )
+    fusionnes = 0
+    for _, groupe in lignes.groupby("canonique", sort=False):
+        if len(groupe) < 2:
+            continue
+        gardee, autres = groupe.iloc[0], groupe.iloc[1:]
+        completes = {}
+        for col in colonnes:
+            if col in ("place_id", "phone") or not _vide(gardee[col]):
+                continue
+            valeurs = [v for v in autres[col] if not _vide(v)]
+            if valeurs:
+                completes[col] = valeurs[0]
+        if completes:
+            c.execute(
+                f"UPDATE prospects SET {', '.join(f'{col} = ?' for col in completes)} WHERE place_id = ?",
+                list(completes.values()) + [gardee["place_id"]]
+            )
+        anciens = [(gardee["place_id"], place_id) for place_id in autres["place_id"]]
+        for table, colonne in REFERENCES_PROSPECT:
+            c.executemany(f"UPDATE {table} SET {colonne} = ? WHERE {colonne} = ?", anciens)
+        c.executemany("DELETE FROM prospects WHERE place_id = ?", [(place_id,) for _, place_id in anciens])
+        fusionnes += len(anciens)
+    return fusionnes
+
+
+def _index(c):
+    # Le téléphone est la clé de dédoublonnage des prospects : les fiches qui
+    # partagent un numéro (une fois normalisé) sont fusionnées avant l'index
+    # unique. Les numéros restants sont alors distincts, bruts comme normalisés :
+    # leur passage à la forme canonique est laissé à la migration 6
+    c.execute("UPDATE prospects SET phone = NULL WHERE TRIM(phone) = ''")
+    _fusionner_doublons_prospects(c)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_prospects_phone ON prospects(phone)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_taches_date_debut ON taches(date_debut)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_taches_client ON taches(client_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_taches_commande ON taches(commande_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_commandes_client ON commandes(client_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_commandes_fin_statut ON commandes(date_fin, statut)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historique_place_date ON historique_statuts(place_id, date_changement)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_checklist_items_ordre ON checklist_items(checklist_id, ordre)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_template_items_ordre ON checklist_template_items(template_id, ordre)")
+
+
+def _telephones_canoniques(c):
+    # Seule étape qui réécrit les numéros stockés (la migration 5 ne fait que
+    # fusionner : après elle, aucun numéro normalisé n'est en conflit)
+    renormaliser_telephones(c)
+
+
+def _hash_contenu_prospects(c):
+    _ajouter_colonne(c, "prospects", "hash_contenu", "TEXT")
+
+
+def _jobs_import(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS import_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nom_fichier TEXT,
+        chemin TEXT,
+        statut TEXT DEFAULT 'en attente',
+        lignes_total INTEGER,
+        lignes_traitees INTEGER DEFAULT 0,
+        morceaux_termines INTEGER DEFAULT 0,
+        inseres INTEGER DEFAULT 0,
+        mis_a_jour INTEGER DEFAULT 0,
+        inchanges INTEGER DEFAULT 0,
+        rejetes INTEGER DEFAULT 0,
+        erreur TEXT,
+        date_creation TEXT,
+        date_maj TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS import_rejets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER,
+        ligne INTEGER,
+        raison TEXT,
+        FOREIGN KEY(job_id) REFERENCES import_jobs(job_id)
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_import_rejets_job ON import_rejets(job_id, ligne)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_statut ON import_jobs(statut)")
+
+
+# Colonnes indexées par la recherche plein texte (l'index des prospects,
+# d'abord calé sur leur rowid implicite, est refait par la migration 15)
+COLONNES_FTS = {
+    "prospects": ("rowid", ["name", "main_category", "categories", "address", "query", "phone"]),
+    "clients": ("client_id", ["name", "phone", "address"]),
+}
+
+
+def _recherche_plein_texte(c):
+    for table, (cle, colonnes) in COLONNES_FTS.items():
+        liste = ", ".join(colonnes)
+        anciennes = ", ".join(f"old.{col}" for col in colonnes)
+        nouvelles = ", ".join(f"new.{col}" for col in colonnes)
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+            {liste}, content='{table}', content_rowid='{cle}', tokenize='unicode61 remove_diacritics 2'
+        )""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts (rowid, {liste}) VALUES (new.{cle}, {nouvelles});
+        END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {liste}) VALUES ('delete', old.{cle}, {anciennes});
+        END""")
+        # Les changements de statut d'appel ne touchent pas l'index
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {liste} ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, {liste}) VALUES ('delete', old.{cle}, {anciennes});
+            INSERT INTO {table}_fts (rowid, {liste}) VALUES (new.{cle}, {nouvelles});
+        END""")
+        c.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def _index_dashboard(c):
+    # Plages de dates des indicateurs du Dashboard
+    c.execute("CREATE INDEX IF NOT EXISTS idx_commandes_date_debut ON commandes(date_debut)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_clients_date_conversion ON clients(date_conversion)")
+
+
+def _stats_quotidiennes(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_stats (
+        jour TEXT,
+        metrique TEXT,
+        valeur NUMERIC DEFAULT 0,
+        PRIMARY KEY (jour, metrique)
+    ) WITHOUT ROWID''')
+    for instruction in triggers_stats():
+        c.execute(instruction)
+    reconstruire_stats(c)
+
+
+def _horodatages_taches(c):
+    # Dates écrites tantôt en datetime Python, tantôt en "%Y-%m-%d %H:%M" ou en
+    # simple date : tout passe au format FORMAT_HORODATAGE
+    for colonne in ("date_debut", "date_fin"):
+        canonique = f"strftime('{FORMAT_HORODATAGE}', {colonne})"
+        c.execute(f"""
+            UPDATE taches SET {colonne} = {canonique}
+            WHERE {canonique} IS NOT NULL AND {colonne} != {canonique}
+        """)
+        # Formats que SQLite ne sait pas lire (ex. 17/10/2025 10:00) : pandas en dernier recours
+        restants = c.execute(
+            f"SELECT tache_id, {colonne} FROM taches WHERE {colonne} IS NOT NULL AND {canonique} IS NULL"
+        ).fetchall()
+        if restants:
+            ids, valeurs = zip(*restants)
+            dates = pd.to_datetime(pd.Series(valeurs, dtype=str), errors="coerce", dayfirst=True, format="mixed")
+            c.executemany(
+                f"UPDATE taches SET {colonne} = ? WHERE tache_id = ?",
+                [(d.strftime(FORMAT_HORODATAGE), id_) for id_, d in zip(ids, dates) if pd.notna(d)]
+            )
+
+
+def _generations(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS generations (
+        nom TEXT PRIMARY KEY,
+        generation INTEGER DEFAULT 0
+    )''')
+    for table in TABLES_SUIVIES:
+        c.execute("INSERT OR IGNORE INTO generations (nom) VALUES (?)", (table,))
+        for evenement in ("INSERT", "UPDATE", "DELETE"):
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_generation_{evenement.lower()}
+                AFTER {evenement} ON {table} BEGIN
+                    UPDATE generations SET generation = generation + 1 WHERE nom = '{table}';
+                END""")
+
+
+def _recurrence_taches(c):
+    # Règle de répétition d'une tâche (mêmes valeurs que commandes.recurrence)
+    _ajouter_colonne(c, "taches", "recurrence", "TEXT")
+
+
+def _recherche_prospects_place_id(c):
+    # prospects n'a pas de clé entière et un VACUUM peut renuméroter son rowid :
+    # l'index devient « contentless » et ses rowid sont tenus par une table de
+    # correspondance fts_id -> place_id, stable quoi qu'il arrive à prospects
+    _, colonnes = COLONNES_FTS["prospects"]
+    liste = ", ".join(colonnes)
+    anciennes = ", ".join(f"old.{col}" for col in colonnes)
+    nouvelles = ", ".join(f"new.{col}" for col in colonnes)
+    id_ancien = "(SELECT fts_id FROM prospects_fts_ids WHERE prospect_id = old.place_id)"
+    id_nouveau = "(SELECT fts_id FROM prospects_fts_ids WHERE prospect_id = new.place_id)"
+    for evenement in ("ai", "ad", "au"):
+        c.execute(f"DROP TRIGGER IF EXISTS prospects_fts_{evenement}")
+    c.execute("DROP TABLE IF EXISTS prospects_fts")
+    c.execute('''CREATE TABLE IF NOT EXISTS prospects_fts_ids (
+        fts_id INTEGER PRIMARY KEY,
+        prospect_id TEXT UNIQUE NOT NULL
+    )''')
+    c.execute(f"""CREATE VIRTUAL TABLE prospects_fts USING fts5(
+        {liste}, content='', tokenize='unicode61 remove_diacritics 2'
+    )""")
+    c.execute(f"""CREATE TRIGGER prospects_fts_ai AFTER INSERT ON prospects BEGIN
+        INSERT INTO prospects_fts_ids (prospect_id) VALUES (new.place_id);
+        INSERT INTO prospects_fts (rowid, {liste}) VALUES ({id_nouveau}, {nouvelles});
+    END""")
+    c.execute(f"""CREATE TRIGGER prospects_fts_ad AFTER DELETE ON prospects BEGIN
+        INSERT INTO prospects_fts (prospects_fts, rowid, {liste}) VALUES ('delete', {id_ancien}, {anciennes});
+        DELETE FROM prospects_fts_ids WHERE prospect_id = old.place_id;
+    END""")
+    # Un upsert sur le téléphone peut changer le place_id : la correspondance suit
+    c.execute(f"""CREATE TRIGGER prospects_fts_au AFTER UPDATE OF place_id, {liste} ON prospects BEGIN
+        INSERT INTO prospects_fts (prospects_fts, rowid, {liste}) VALUES ('delete', {id_ancien}, {anciennes});
+        UPDATE prospects_fts_ids SET prospect_id = new.place_id WHERE prospect_id = old.place_id;
+        INSERT INTO prospects_fts (rowid, {liste}) VALUES ({id_nouveau}, {nouvelles});
+    END""")
+    c.execute("INSERT OR IGNORE INTO prospects_fts_ids (prospect_id) SELECT place_id FROM prospects")
+    c.execute(f"""INSERT INTO prospects_fts (rowid, {liste})
+        SELECT ids.fts_id, {", ".join(f"p.{col}" for col in colonnes)}
+        FROM prospects p JOIN prospects_fts_ids ids ON ids.prospect_id = p.place_id""")
+
+
+def _journal_taches(c):
+    # Dernière modification de créneau de chaque tâche (une ligne par tâche,
+    # seq croissant) : l'index des conflits (creneaux.py) ne relit que les
+    # tâches journalisées depuis sa dernière mise à jour
+    c.execute('''CREATE TABLE IF NOT EXISTS taches_journal (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tache_id INTEGER UNIQUE
+    )''')
+    for nom, evenement, ligne in (
+        ("ai", "INSERT", "new"),
+        ("au", "UPDATE OF date_debut, date_fin, titre", "new"),
+        ("ad", "DELETE", "old"),
+    ):
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS taches_journal_{nom} AFTER {evenement} ON taches BEGIN
+            INSERT OR REPLACE INTO taches_journal (tache_id) VALUES ({ligne}.tache_id);
+        END""")
+
+
+MIGRATIONS = [
+    (1, "Tables de base", _tables_de_base),
+    (2, "Tables des checklists", _tables_checklists),
+    (3, "Nom de service par défaut", _nom_service_par_defaut),
+    (4, "Colonne devis_envoye", _colonne_devis_envoye),
+    (5, "Index des requêtes fréquentes", _index),
+    (6, "Téléphones au format canonique", _telephones_canoniques),
+    (7, "Hash du contenu importé des prospects", _hash_contenu_prospects),
+    (8, "Jobs d'import en tâche de fond", _jobs_import),
+    (9, "Recherche plein texte prospects/clients", _recherche_plein_texte),
+    (10, "Index des périodes du Dashboard", _index_dashboard),
+    (11, "Statistiques quotidiennes (daily_stats)", _stats_quotidiennes),
+    (12, "Horodatages des tâches au format ISO", _horodatages_taches),
+    (13, "Compteurs de génération du cache de lecture", _generations),
+    (14, "Récurrence des tâches", _recurrence_taches),
+    (15, "Recherche plein texte des prospects sur place_id", _recherche_prospects_place_id),
+    (16, "Journal des créneaux modifiés (index des conflits)", _journal_taches),
+]
+
+
+def migrate(conn):
+    """Applique les migrations manquantes et renvoie la version du schéma."""
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        date_application TEXT
+    )''')
+    version = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    for numero, description, etape in MIGRATIONS:
+        if numero <= version:
+            continue
+        with conn:
+            c.execute("BEGIN")
+            etape(c)
+            c.execute(
+                "INSERT INTO schema_version (version, description, date_application) VALUES (?, ?, ?)",
+                (numero, description, datetime.now().isoformat())
+            )
+        version = numero
+    return version
+
+
+@st.cache_resource
+def init_db():
+    """Met la base à jour une seule fois par processus (et non à chaque rerun)."""
+    conn = connect()
+    try:
+        return migrate(conn)
+    finally:
+        conn.close()
@@ -1,13 +1,11 @@
 import streamlit as st
-import sqlite3
+from db import get_connection
 import pandas as pd
 
-DB_PATH = "crm_data.db"
-
 st.title("Modèles de checklist")
 
 # --- Liste des modèles ---
-with sqlite3.connect(DB_PATH) as conn:
+with get_connection() as conn:
     templates = pd.read_sql_query("SELECT * FROM checklist_templates", conn)
 
 if st.button("Créer un modèle de checklist"):
@@ -18,7 +16,7 @@ if st.session_state.get('show_new_template'):
         description = st.text_area("Description")
         submitted = st.form_submit_button("Créer")
         if submitted and nom:
-            with sqlite3.connect(DB_PATH) as conn:
+            with get_connection() as conn:
                 c = conn.cursor()
                 c.execute("INSERT INTO checklist_templates (nom, description) VALUES (?, ?)", (nom, description))
                 conn.commit()
@@ -33,7 +31,7 @@ if not templates.empty:
     for _, tpl in templates.iterrows():
         st.subheader(f"Modèle : {tpl['nom']}")
         st.write(tpl['description'])
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_connection() as conn:
             items = pd.read_sql_query("SELECT * FROM checklist_template_items WHERE template_id=? ORDER BY ordre", conn, params=(tpl['id'],))
         for idx, item in items.iterrows():
             st.markdown(f"{idx+1}. {item['texte']}")
@@ -44,7 +42,7 @@ if not templates.empty:
                 texte = st.text_input("Texte de l'item")
                 ordre = st.number_input("Ordre", min_value=1, value=len(items)+1)
                 if st.form_submit_button("Ajouter") and texte:
-                    with sqlite3.connect(DB_PATH) as conn:
+                    with get_connection() as conn:
                         c = conn.cursor()
                         c.execute("INSERT INTO checklist_template_items (template_id, texte, ordre) VALUES (?, ?, ?)", (tpl['id'], texte, ordre))
                         conn.commit()
@@ -55,7 +53,7 @@ if not templates.empty:
                     st.session_state[f"show_add_item_tpl_{tpl['id']}"] = False
                     st.rerun()
         if st.button(f"Supprimer ce modèle", key=f"del_tpl_{tpl['id']}"):
-            with sqlite3.connect(DB_PATH) as conn:
+            with get_connection() as conn:
                 c = conn.cursor()
                 c.execute("DELETE FROM checklist_template_items WHERE template_id=?", (tpl['id'],))
                 c.execute("DELETE FROM checklist_templates WHERE id=?", (tpl['id'],))
@@ -1,9 +1,17 @@
 import streamlit as st
-import sqlite3
+from db import get_connection, horodatage, bornes_jours
+from metriques import stats_jour
+from cache import lire
+from recurrences import taches_recurrentes, RECURRENCES
+from creneaux import controler_creneau, HEURES_OUVRABLES, DUREE_PAR_DEFAUT
+from fiches import fiche_client, fiche_prospect, fiche_tache, commandes_client
 import pandas as pd
 from datetime import datetime, timedelta
 import calendar
+import html
 import locale
+import queue
+import threading
 
 # Configuration locale pour les noms en français
 try:
@@ -15,49 +23,21 @@ except:
         pass
 
 # Constantes
-DB_PATH = "crm_data.db"
 TYPES_TACHE = ["tache", "r1", "maintenance", "upsell", "à rappeller"]
 JOURS_SEMAINE = ["Lun", "Mar", "Mer", "Jeu", "Ven", "Sam", "Dim"]
 HEURES_TRAVAIL = [f"{h:02d}:00" for h in range(24)]  # De 00h à 23h
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Table des tâches
-    c.execute('''CREATE TABLE IF NOT EXISTS taches (
-        tache_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        client_id INTEGER,
-        commande_id INTEGER,
-        type_tache TEXT,
-        titre TEXT,
-        description TEXT,
-        date_debut DATETIME,
-        date_fin DATETIME,
-        temps_passe FLOAT,
-        statut TEXT DEFAULT 'à faire',
-        est_process BOOLEAN DEFAULT 0,
-        service TEXT,
-        FOREIGN KEY(client_id) REFERENCES clients(client_id),
-        FOREIGN KEY(commande_id) REFERENCES commandes(commande_id)
-    )''')
-    
-    conn.commit()
-    conn.close()
-
 def get_client_name(client_id):
     if not client_id:
         return "Process"
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.read_sql_query("SELECT name FROM clients WHERE client_id = ?", conn, params=(client_id,))
-        return df.iloc[0]['name'] if not df.empty else "Client inconnu"
+    df = lire("SELECT name FROM clients WHERE client_id = ?", (client_id,), ["clients"])
+    return df.iloc[0]['name'] if not df.empty else "Client inconnu"
 
 def get_commande_service(commande_id):
     if not commande_id:
         return ""
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.read_sql_query("SELECT nom_service FROM commandes WHERE commande_id = ?", conn, params=(commande_id,))
-        return df.iloc[0]['nom_service'] if not df.empty else ""
+    df = lire("SELECT nom_service FROM commandes WHERE commande_id = ?", (commande_id,), ["commandes"])
+    return df.iloc[0]['nom_service'] if not df.empty else ""
 
 def format_duration(start, end):
     if not start or not end:
@@ -71,32 +51,231 @@ def get_month_calendar(year, month):
     return cal
 
 def get_tasks_for_period(start_date, end_date):
-    with sqlite3.connect(DB_PATH) as conn:
-        query = """
-        SELECT t.*, c.name as client_name, co.nom_service
-        FROM taches t
-        LEFT JOIN clients c ON t.client_id = c.client_id
-        LEFT JOIN commandes co ON t.commande_id = co.commande_id
-        WHERE date(t.date_debut) >= date(?) AND date(t.date_debut) <= date(?)
-        """
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-    return df
+    query = """
+    SELECT t.*, c.name as client_name, co.nom_service
+    FROM taches t
+    LEFT JOIN clients c ON t.client_id = c.client_id
+    LEFT JOIN commandes co ON t.commande_id = co.commande_id
+    WHERE t.date_debut >= ? AND t.date_debut < ?
+    """
+    # Plage semi-ouverte sur la colonne brute : parcours de idx_taches_date_debut
+    return lire(query, bornes_jours(start_date, end_date), ["taches", "clients", "commandes"])
+
+# --- Navigation entre périodes et préchargement des voisines ---
+# La période affichée est gardée en session ; les périodes précédente et
+# suivante sont lues par un thread de fond via get_tasks_for_period, ce qui
+# les place dans le cache de lecture (cache.lire, LRU invalidé à chaque
+# écriture) : changer de mois ou de semaine est alors immédiat.
+_a_precharger = queue.Queue()
+
+def _boucle_prechargement():
+    while True:
+        debut, fin = _a_precharger.get()
+        try:
+            get_tasks_for_period(debut, fin)
+        except Exception:
+            pass  # simple préchargement : la page relira la période si besoin
+
+@st.cache_resource
+def demarrer_prechargement():
+    """Démarre le thread de préchargement une seule fois par processus."""
+    thread = threading.Thread(target=_boucle_prechargement, name="planning-prechargement", daemon=True)
+    thread.start()
+    return thread
+
+def precharger(*periodes):
+    """Demande le chargement en tâche de fond de périodes (premier jour, dernier jour)."""
+    demarrer_prechargement()
+    for periode in periodes:
+        _a_precharger.put(periode)
+
+def bornes_mois(annee, mois):
+    """Premier et dernier jour du mois."""
+    return datetime(annee, mois, 1), datetime(annee, mois, calendar.monthrange(annee, mois)[1])
+
+def decaler_mois(annee, mois, pas):
+    """(année, mois) décalé de `pas` mois."""
+    index = annee * 12 + mois - 1 + pas
+    return index // 12, index % 12 + 1
+
+def changer_mois(pas):
+    st.session_state['planning_mois'] = decaler_mois(*st.session_state['planning_mois'], pas)
+
+def changer_semaine(pas):
+    st.session_state['planning_semaine'] += timedelta(days=7 * pas)
+
+def nom_client(task):
+    """Nom du client d'une tâche, « Process » pour les tâches sans client (NULL lu en NaN)."""
+    return task['client_name'] if pd.notna(task['client_name']) else "Process"
+
+def filtrer_taches(tasks, recherche, type_tache):
+    """Applique la recherche (client, titre, type) et le filtre de type à tout le DataFrame."""
+    if recherche:
+        motif = recherche.lower()
+        masque = pd.Series(False, index=tasks.index)
+        for col in ("client_name", "titre", "type_tache"):
+            masque |= tasks[col].fillna("").astype(str).str.lower().str.contains(motif, regex=False)
+        tasks = tasks[masque]
+    if type_tache != "Tous":
+        tasks = tasks[tasks['type_tache'] == type_tache]
+    return tasks
+
+def grille_semaine(tasks):
+    """Index {(date, "HH:00"): tâches} construit en une passe sur date_debut."""
+    debuts = pd.to_datetime(tasks['date_debut'], errors='coerce')
+    return {
+        (jour, heure): groupe
+        for (jour, heure), groupe in tasks.groupby([debuts.dt.date, debuts.dt.strftime('%H:00')])
+    }
+
+def grille_mois(tasks):
+    """Index {jour du mois: tâches} construit en une passe sur date_debut."""
+    jours = pd.to_datetime(tasks['date_debut'], errors='coerce').dt.day
+    return {int(jour): groupe for jour, groupe in tasks.groupby(jours)}
+
+STYLE_TERMINE = "background-color:#d4edda;color:#155724;font-weight:bold;border-radius:6px;padding:2px 6px;"
+STYLE_A_FAIRE = "background-color:#fff3cd;color:#856404;border-radius:6px;padding:2px 6px;"
+STYLE_RECURRENTE = "background-color:#e7f1ff;color:#084298;border-radius:6px;padding:2px 6px;"
+PLAGE_TRAVAIL = HEURES_OUVRABLES  # heures toujours affichées en mode compact
+
+def lignes_semaine(grille, debut_plage, fin_plage):
+    """Lignes de la grille compacte : heures de la plage de travail et heures
+    occupées ; les heures vides consécutives hors plage sont regroupées."""
+    occupees = {heure for _, heure in grille}
+    lignes, vides = [], []
+    for h, heure in enumerate(HEURES_TRAVAIL):
+        if debut_plage <= h < fin_plage or heure in occupees:
+            if vides:
+                lignes.append(("vide", vides))
+                vides = []
+            lignes.append(("heure", heure))
+        else:
+            vides.append(heure)
+    if vides:
+        lignes.append(("vide", vides))
+    return lignes
+
+def bloc_recurrent(task):
+    """Occurrence calculée d'une récurrence (affichage seul, pas de ligne en base)."""
+    return (
+        f'<div style="{STYLE_RECURRENTE}margin-bottom:2px;">↻ {html.escape(str(task["titre"]))}'
+        f' - {html.escape(str(nom_client(task)))}</div>'
+    )
+
+def html_semaine(grille, jours, lignes, recurrentes=None):
+    """Grille hebdomadaire compacte en un seul tableau HTML (recurrentes : même index que grille)."""
+    recurrentes = recurrentes or {}
+    entetes = "".join(f"<th>{nom} {jour.strftime('%d/%m')}</th>" for nom, jour in zip(JOURS_SEMAINE, jours))
+    corps = []
+    for ligne in lignes:
+        if ligne[0] == "vide":
+            heures = ligne[1]
+            corps.append(
+                f'<tr><td colspan="8"><details><summary>{heures[0]} – {heures[-1][:2]}:59 : aucune tâche</summary>'
+                f'{", ".join(heures)}</details></td></tr>'
+            )
+            continue
+        heure = ligne[1]
+        cellules = []
+        for jour in jours:
+            taches = grille.get((jour, heure))
+            blocs = "" if taches is None else "".join(
+                f'<div style="{STYLE_TERMINE if task["statut"] == "terminé" else STYLE_A_FAIRE}margin-bottom:2px;">'
+                f'{html.escape(str(task["titre"]))} - {html.escape(str(nom_client(task)))}</div>'
+                for _, task in taches.iterrows()
+            )
+            occurrences = recurrentes.get((jour, heure))
+            if occurrences is not None:
+                blocs += "".join(bloc_recurrent(task) for _, task in occurrences.iterrows())
+            cellules.append(f"<td>{blocs}</td>")
+        corps.append(f"<tr><th>{heure}</th>{''.join(cellules)}</tr>")
+    return (
+        '<table style="width:100%;table-layout:fixed;font-size:0.85em">'
+        f"<tr><th></th>{entetes}</tr>{''.join(corps)}</table>"
+    )
+
+def selectionner_tache(task):
+    """Prépare l'état du formulaire d'action pour la tâche choisie."""
+    st.session_state['selected_task'] = task['tache_id']
+    st.session_state['selected_action'] = "Marquer comme complétée"
+    st.session_state['retard_date'] = pd.to_datetime(task['date_debut']).date()
+    st.session_state['retard_time'] = pd.to_datetime(task['date_debut']).time()
+
+def choisir_tache_semaine(taches):
+    """Rappel de la liste des tâches de la vue compacte (taches : {tache_id: ligne})."""
+    tache_id = st.session_state["tache_hebdo"]
+    if tache_id is None:
+        st.session_state['selected_task'] = None
+    else:
+        selectionner_tache(taches[tache_id])
+
+def formulaire_action_tache(task, key):
+    """Actions sur la tâche sélectionnée : compléter, retarder ou annuler."""
+    st.write(f"**Action sur la tâche : {task['titre']}**")
+    actions = ["Marquer comme complétée", "Retarder", "Annuler"]
+    selected_action = st.session_state.get('selected_action', actions[0])
+    action = st.radio("Action", actions, index=actions.index(selected_action), key=f"radio_{key}")
+    st.session_state['selected_action'] = action
+    with st.form(f"form_{key}"):
+        if action == "Retarder":
+            retard_date = st.date_input("Nouvelle date", value=st.session_state.get('retard_date', pd.to_datetime(task['date_debut']).date()), key=f"date_{key}")
+            retard_time = st.time_input("Nouvelle heure", value=st.session_state.get('retard_time', pd.to_datetime(task['date_debut']).time()), key=f"time_{key}")
+            st.session_state['retard_date'] = retard_date
+            st.session_state['retard_time'] = retard_time
+            forcer = st.checkbox("Retarder même si le créneau est occupé", key=f"forcer_{key}")
+        col1, col2 = st.columns(2)
+        with col1:
+            submitted = st.form_submit_button("Valider")
+        with col2:
+            fermer = st.form_submit_button("Fermer")
+        creneau_libre = True
+        if submitted and action == "Retarder":
+            # La tâche garde sa durée (celle d'un rappel si elle n'a pas de fin valable)
+            debut = pd.to_datetime(task['date_debut'], errors="coerce")
+            fin = pd.to_datetime(task['date_fin'], errors="coerce")
+            duree = (fin - debut).to_pytimedelta() if pd.notna(fin) and pd.notna(debut) and fin > debut else DUREE_PAR_DEFAUT
+            new_dt = datetime.combine(st.session_state['retard_date'], st.session_state['retard_time'])
+            new_fin = new_dt + duree if pd.notna(fin) else None
+            creneau_libre = controler_creneau(new_dt, new_dt + duree, ignorer=int(task['tache_id']), forcer=forcer)
+        if submitted and creneau_libre:
+            with get_connection() as conn:
+                c = conn.cursor()
+                if action == "Marquer comme complétée":
+                    c.execute("UPDATE taches SET statut='terminé' WHERE tache_id=?", (task['tache_id'],))
+                elif action == "Retarder":
+                    c.execute("UPDATE taches SET date_debut=?, date_fin=?, statut='à faire' WHERE tache_id=?",
+                              (horodatage(new_dt), horodatage(new_fin), task['tache_id']))
+                elif action == "Annuler":
+                    c.execute("DELETE FROM taches WHERE tache_id=?", (task['tache_id'],))
+                conn.commit()
+            st.success("Action effectuée !")
+            st.session_state['selected_task'] = None
+            st.session_state['selected_action'] = None
+            st.session_state['retard_date'] = None
+            st.session_state['retard_time'] = None
+            st.rerun()
+        if fermer:
+            st.session_state['selected_task'] = None
+            st.session_state['selected_action'] = None
+            st.session_state['retard_date'] = None
+            st.session_state['retard_time'] = None
+            st.rerun()
 
 # Fonction utilitaire pour afficher les détails client/prospect (extrait de crm_clients.py)
 def afficher_details_client_sidebar(client_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.read_sql_query("SELECT * FROM clients", conn)
-        commandes = pd.read_sql_query("SELECT * FROM commandes", conn)
-    client_row = df[df['client_id'] == client_id].iloc[0]
+    client_row = fiche_client(client_id)
+    if client_row is None:
+        st.sidebar.warning("Client introuvable.")
+        return
     st.sidebar.subheader(f"Détails pour {client_row.get('name', 'Non renseigné')}")
     st.sidebar.markdown(f"**Téléphone :** {client_row.get('phone', 'Non renseigné')}")
     st.sidebar.markdown(f"**Adresse :** {client_row.get('address', 'Non renseigné')}")
     st.sidebar.markdown(f"**Dernier contact :** {client_row.get('last_contact', 'Non renseigné')}")
     st.sidebar.markdown(f"**Date conversion :** {client_row.get('date_conversion', 'Non renseigné')}")
-    client_commandes = commandes[commandes['client_id'] == client_id]
-    if not client_commandes.empty:
+    client_commandes = commandes_client(client_id)
+    if client_commandes:
         st.sidebar.markdown("**Commandes :**")
-        for _, cmd in client_commandes.iterrows():
+        for cmd in client_commandes:
             statut = cmd.get('statut', 'En cours')
             statut_color = 'green' if statut == 'livré' else 'orange'
             st.sidebar.markdown(f"• **{cmd.get('nom_service', 'Sans nom')}** - {cmd.get('prix', 0)}€ - <span style='color:{statut_color}'>{statut}</span>", unsafe_allow_html=True)
@@ -126,281 +305,183 @@ def afficher_details_client_sidebar(client_id):
 # --- Fonction utilitaire pour afficher uniquement le numéro de téléphone dans la sidebar (client ou prospect) ---
 def afficher_details_telephone_sidebar(id_):
     # On tente d'abord comme client_id
-    with sqlite3.connect(DB_PATH) as conn:
-        df_client = pd.read_sql_query("SELECT * FROM clients WHERE client_id = ?", conn, params=(id_,))
-        if not df_client.empty:
-            client = df_client.iloc[0]
-            st.sidebar.subheader(f"Client : {client.get('name', 'Non renseigné')}")
-            st.sidebar.markdown(f"**Téléphone :** {client.get('phone', 'Non renseigné')}")
-            if st.sidebar.button("Fermer", key=f"close_tel_details_{id_}"):
-                st.session_state['show_client_details'] = None
-                st.rerun()
-        # Sinon, on tente comme place_id (prospect)
-        df_prospect = pd.read_sql_query("SELECT * FROM prospects WHERE place_id = ?", conn, params=(id_,))
-        if not df_prospect.empty:
-            prospect = df_prospect.iloc[0]
-            st.sidebar.subheader(f"Prospect : {prospect.get('name', 'Non renseigné')}")
-            st.sidebar.markdown(f"**Téléphone :** {prospect.get('phone', 'Non renseigné')}")
-            if st.sidebar.button("Fermer", key=f"close_tel_details_{id_}"):
-                st.session_state['show_client_details'] = None
-                st.rerun()
+    client = fiche_client(id_)
+    if client is not None:
+        st.sidebar.subheader(f"Client : {client.get('name', 'Non renseigné')}")
+        st.sidebar.markdown(f"**Téléphone :** {client.get('phone', 'Non renseigné')}")
+        if st.sidebar.button("Fermer", key=f"close_tel_details_{id_}"):
+            st.session_state['show_client_details'] = None
+            st.rerun()
+    # Sinon, on tente comme place_id (prospect)
+    prospect = fiche_prospect(id_)
+    if prospect is not None:
+        st.sidebar.subheader(f"Prospect : {prospect.get('name', 'Non renseigné')}")
+        st.sidebar.markdown(f"**Téléphone :** {prospect.get('phone', 'Non renseigné')}")
+        if st.sidebar.button("Fermer", key=f"close_tel_details_{id_}"):
+            st.session_state['show_client_details'] = None
+            st.rerun()
 
-def migrate_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        # Ajout du champ date_fin si absent
-        c.execute("PRAGMA table_info(taches)")
-        columns = [col[1] for col in c.fetchall()]
-        if "date_fin" not in columns:
-            c.execute("ALTER TABLE taches ADD COLUMN date_fin DATETIME")
-        if "temps_passe" not in columns:
-            c.execute("ALTER TABLE taches ADD COLUMN temps_passe FLOAT")
-        conn.commit()
-
-migrate_db()
-
-# Initialisation de la base de données
-init_db()
-
-# Titre de la page
-st.title("Planning")
-
-# Onglets principaux
-tab1, tab2, tab3 = st.tabs(["À faire", "Calendrier", "Planning hebdomadaire"])
-
-with tab1:
-    # Section À faire aujourd'hui
-    st.subheader("À faire aujourd'hui")
-    today = datetime.now().date()
-    today_tasks = get_tasks_for_period(today, today)
-    if not today_tasks.empty:
-        for _, task in today_tasks.iterrows():
-            st.info(f"{task['titre']} - {task['client_name'] if task['client_name'] else 'Process'}")
-    else:
-        st.info("Aucune tâche pour aujourd'hui")
+def render():
+    # Titre de la page
+    st.title("Planning")
+
+    # Onglets principaux
+    tab1, tab2, tab3 = st.tabs(["À faire", "Calendrier", "Planning hebdomadaire"])
+
+    with tab1:
+        # Section À faire aujourd'hui
+        st.subheader("À faire aujourd'hui")
+        today = datetime.now().date()
+        today_tasks = get_tasks_for_period(today, today)
+        today_recurrentes = taches_recurrentes(today, today)
+        if not today_tasks.empty or not today_recurrentes.empty:
+            for _, task in today_tasks.iterrows():
+                st.info(f"{task['titre']} - {nom_client(task)}")
+            for _, task in today_recurrentes.iterrows():
+                st.info(f"↻ {task['titre']} - {nom_client(task)}")
+        else:
+            st.info("Aucune tâche pour aujourd'hui")
     
-    col1, col2 = st.columns(2)
+        col1, col2 = st.columns(2)
     
-    with col1:
-        st.subheader("Deadlines proches")
-        with sqlite3.connect(DB_PATH) as conn:
-            today = datetime.now().date()
-            five_days = today + timedelta(days=5)
-            df_deadlines = pd.read_sql_query("""
-                SELECT c.commande_id, cl.name as client, c.nom_service, c.date_fin, c.statut
-                FROM commandes c
-                JOIN clients cl ON c.client_id = cl.client_id
-                WHERE c.date_fin <= ? AND c.statut != 'validé'
-                ORDER BY c.date_fin ASC
-            """, conn, params=(five_days.strftime("%Y-%m-%d"),))
+        with col1:
+            st.subheader("Deadlines proches")
+            with get_connection() as conn:
+                today = datetime.now().date()
+                five_days = today + timedelta(days=5)
+                df_deadlines = pd.read_sql_query("""
+                    SELECT c.commande_id, cl.name as client, c.nom_service, c.date_fin, c.statut
+                    FROM commandes c
+                    JOIN clients cl ON c.client_id = cl.client_id
+                    WHERE c.date_fin <= ? AND c.statut != 'validé'
+                    ORDER BY c.date_fin ASC
+                """, conn, params=(five_days.strftime("%Y-%m-%d"),))
             
-            if not df_deadlines.empty:
-                for _, row in df_deadlines.iterrows():
-                    date_fin = pd.to_datetime(row['date_fin']).date()
-                    jours_restants = (date_fin - today).days
-                    status = "🔴 En retard" if jours_restants < 0 else "🟡 Bientôt"
-                    st.warning(f"{status} : {row['client']} - {row['nom_service']} ({jours_restants} jours)")
-            else:
-                st.info("Aucune deadline proche")
+                if not df_deadlines.empty:
+                    for _, row in df_deadlines.iterrows():
+                        date_fin = pd.to_datetime(row['date_fin']).date()
+                        jours_restants = (date_fin - today).days
+                        status = "🔴 En retard" if jours_restants < 0 else "🟡 Bientôt"
+                        st.warning(f"{status} : {row['client']} - {row['nom_service']} ({jours_restants} jours)")
+                else:
+                    st.info("Aucune deadline proche")
     
-    with col2:
-        st.subheader("Rendez-vous du jour")
-        with sqlite3.connect(DB_PATH) as conn:
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_end = today_start + timedelta(days=1)
-            df_rdv = pd.read_sql_query("""
-                SELECT type_tache, COUNT(*) as count
-                FROM taches
-                WHERE date_debut >= ? AND date_debut < ?
-                AND type_tache IN ('r1', 'à rappeller', 'upsell', 'maintenance')
-                GROUP BY type_tache
-            """, conn, params=(today_start, today_end))
+        with col2:
+            st.subheader("Rendez-vous du jour")
+            with get_connection() as conn:
+                today_start, today_end = bornes_jours(today, today)
+                df_rdv = pd.read_sql_query("""
+                    SELECT type_tache, COUNT(*) as count
+                    FROM taches
+                    WHERE date_debut >= ? AND date_debut < ?
+                    AND type_tache IN ('r1', 'à rappeller', 'upsell', 'maintenance')
+                    GROUP BY type_tache
+                """, conn, params=(today_start, today_end))
             
-            if not df_rdv.empty:
-                for _, row in df_rdv.iterrows():
-                    st.info(f"{row['type_tache']}: {row['count']}")
-            else:
-                st.info("Aucun rendez-vous aujourd'hui")
+                if not df_rdv.empty:
+                    for _, row in df_rdv.iterrows():
+                        st.info(f"{row['type_tache']}: {row['count']}")
+                else:
+                    st.info("Aucun rendez-vous aujourd'hui")
 
-    # Compteurs
-    st.write("---")
-    st.subheader("Compteurs du jour")
-    col1, col2, col3, col4 = st.columns(4)
+        # Compteurs
+        st.write("---")
+        st.subheader("Compteurs du jour")
+        col1, col2, col3, col4 = st.columns(4)
     
-    with sqlite3.connect(DB_PATH) as conn:
-        # Tâches effectuées
-        df_taches = pd.read_sql_query("""
-            SELECT COUNT(*) as count
-            FROM taches
-            WHERE date_debut >= ? AND date_debut < ?
-            AND statut = 'terminé'
-        """, conn, params=(today_start, today_end))
-        
-        # Heures travaillées
-        df_heures = pd.read_sql_query("""
-            SELECT COUNT(*) as hours
-            FROM taches
-            WHERE date_debut >= ? AND date_debut < ?
-            AND statut = 'terminé'
-        """, conn, params=(today_start, today_end))
-        
-        # R1 effectués
-        df_r1 = pd.read_sql_query("""
-            SELECT COUNT(*) as count
-            FROM taches
-            WHERE date_debut >= ? AND date_debut < ?
-            AND type_tache = 'r1'
-            AND statut = 'terminé'
-        """, conn, params=(today_start, today_end))
-        
-        # Missions terminées
-        df_missions = pd.read_sql_query("""
-            SELECT COUNT(*) as count
-            FROM commandes
-            WHERE date_fin >= ? AND date_fin < ?
-            AND statut = 'validé'
-        """, conn, params=(today_start, today_end))
+        # Lus dans daily_stats (pré-agrégé par jour)
+        with get_connection() as conn:
+            compteurs = stats_jour(conn, today, ["missions", "heures", "r1_termines", "missions_validees"])
     
-    with col1:
-        st.metric("Tâches effectuées", df_taches.iloc[0]['count'])
-    with col2:
-        heures = df_heures.iloc[0]['hours']
-        st.metric("Heures travaillées", f"{heures if heures else 0}")
-    with col3:
-        st.metric("R1 effectués", df_r1.iloc[0]['count'])
-    with col4:
-        st.metric("Missions terminées", df_missions.iloc[0]['count'])
-
-with tab2:
-    st.subheader("Calendrier mensuel")
+        with col1:
+            st.metric("Tâches effectuées", compteurs["missions"])
+        with col2:
+            st.metric("Heures travaillées", f"{compteurs['heures']:g}")
+        with col3:
+            st.metric("R1 effectués", compteurs["r1_termines"])
+        with col4:
+            st.metric("Missions terminées", compteurs["missions_validees"])
+
+    with tab2:
+        st.subheader("Calendrier mensuel")
     
-    # Navigation du mois
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+        # Navigation du mois (conservée en session)
+        if 'planning_mois' not in st.session_state:
+            st.session_state['planning_mois'] = (datetime.now().year, datetime.now().month)
     
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col1:
-        if st.button("Mois précédent"):
-            if current_month == 1:
-                current_month = 12
-                current_year -= 1
-            else:
-                current_month -= 1
-    with col2:
-        st.write(f"{calendar.month_name[current_month]} {current_year}")
-    with col3:
-        if st.button("Mois suivant"):
-            if current_month == 12:
-                current_month = 1
-                current_year += 1
-            else:
-                current_month += 1
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("Mois précédent", on_click=changer_mois, args=(-1,))
+        with col3:
+            st.button("Mois suivant", on_click=changer_mois, args=(1,))
+        current_year, current_month = st.session_state['planning_mois']
+        with col2:
+            st.write(f"{calendar.month_name[current_month]} {current_year}")
 
-    # Filtres
-    col1, col2 = st.columns(2)
-    with col1:
-        search = st.text_input("Rechercher...", placeholder="Client, titre ou type")
-    with col2:
-        type_filter = st.selectbox("Type", ["Tous"] + TYPES_TACHE)
+        # Filtres
+        col1, col2 = st.columns(2)
+        with col1:
+            search = st.text_input("Rechercher...", placeholder="Client, titre ou type")
+        with col2:
+            type_filter = st.selectbox("Type", ["Tous"] + TYPES_TACHE)
 
-    # Affichage du calendrier
-    cal = get_month_calendar(current_year, current_month)
-    
-    # En-têtes des jours
-    cols = st.columns(7)
-    for i, jour in enumerate(JOURS_SEMAINE):
-        with cols[i]:
-            st.markdown(f"**{jour}**")
-    
-    # Dates et tâches
-    first_day = datetime(current_year, current_month, 1)
-    last_day = datetime(current_year, current_month + 1, 1) - timedelta(days=1)
-    tasks = get_tasks_for_period(first_day, last_day)
+        # Affichage du calendrier
+        cal = get_month_calendar(current_year, current_month)
     
-    for week in cal:
+        # En-têtes des jours
         cols = st.columns(7)
-        for i, day in enumerate(week):
+        for i, jour in enumerate(JOURS_SEMAINE):
             with cols[i]:
-                if day != 0:
-                    day_name = JOURS_SEMAINE[i]
-                    st.write(f"**{day_name} {day}**")
-                    day_tasks = tasks[pd.to_datetime(tasks['date_debut']).dt.day == day]
-                    if not day_tasks.empty:
-                        for _, task in day_tasks.iterrows():
-                            if (not search or 
-                                search.lower() in str(task['client_name']).lower() or 
-                                search.lower() in str(task['titre']).lower() or 
-                                search.lower() in str(task['type_tache']).lower()):
-                                if type_filter == "Tous" or type_filter == task['type_tache']:
-                                    key = f"task_{task['tache_id']}_mois"
-                                    if task.get('statut') == 'terminé':
-                                        style = "background-color:#d4edda;color:#155724;font-weight:bold;border-radius:6px;padding:2px 6px;"
-                                    else:
-                                        style = "background-color:#fff3cd;color:#856404;border-radius:6px;padding:2px 6px;"
-                                    if st.button(f"{task['titre']}", key=key):
-                                        if st.session_state.get('selected_task') != task['tache_id']:
-                                            st.session_state['selected_task'] = task['tache_id']
-                                            st.session_state['selected_action'] = "Marquer comme complétée"
-                                            st.session_state['retard_date'] = pd.to_datetime(task['date_debut']).date()
-                                            st.session_state['retard_time'] = pd.to_datetime(task['date_debut']).time()
-                                        # Affichage détails si type r1/upsell/rdv
-                                        if str(task.get('type_tache', '')).lower() in ['r1', 'upsell', 'rdv']:
-                                            if task.get('client_id'):
-                                                st.session_state['show_client_details'] = task['client_id']
-                                    st.markdown(f'<div style="{style}">{task["titre"]}</div>', unsafe_allow_html=True)
-                                    if st.session_state.get('selected_task') == task['tache_id']:
-                                        st.write(f"**Action sur la tâche : {task['titre']}**")
-                                        actions = ["Marquer comme complétée", "Retarder", "Annuler"]
-                                        selected_action = st.session_state.get('selected_action', actions[0])
-                                        action = st.radio("Action", actions, index=actions.index(selected_action), key=f"radio_{key}")
-                                        st.session_state['selected_action'] = action
-                                        with st.form(f"form_{key}"):
-                                            if action == "Retarder":
-                                                retard_date = st.date_input("Nouvelle date", value=st.session_state.get('retard_date', pd.to_datetime(task['date_debut']).date()), key=f"date_{key}")
-                                                retard_time = st.time_input("Nouvelle heure", value=st.session_state.get('retard_time', pd.to_datetime(task['date_debut']).time()), key=f"time_{key}")
-                                                st.session_state['retard_date'] = retard_date
-                                                st.session_state['retard_time'] = retard_time
-                                            col1, col2 = st.columns(2)
-                                            with col1:
-                                                submitted = st.form_submit_button("Valider")
-                                            with col2:
-                                                fermer = st.form_submit_button("Fermer")
-                                            if submitted:
-                                                with sqlite3.connect(DB_PATH) as conn:
-                                                    c = conn.cursor()
-                                                    if action == "Marquer comme complétée":
-                                                        c.execute("UPDATE taches SET statut='terminé' WHERE tache_id=?", (task['tache_id'],))
-                                                    elif action == "Retarder":
-                                                        from datetime import datetime
-                                                        new_dt = datetime.combine(st.session_state['retard_date'], st.session_state['retard_time'])
-                                                        c.execute("UPDATE taches SET date_debut=?, statut='à faire' WHERE tache_id=?", (new_dt, task['tache_id']))
-                                                    elif action == "Annuler":
-                                                        c.execute("DELETE FROM taches WHERE tache_id=?", (task['tache_id'],))
-                                                    conn.commit()
-                                                st.success("Action effectuée !")
-                                                st.session_state['selected_task'] = None
-                                                st.session_state['selected_action'] = None
-                                                st.session_state['retard_date'] = None
-                                                st.session_state['retard_time'] = None
-                                                st.rerun()
-                                            if fermer:
-                                                st.session_state['selected_task'] = None
-                                                st.session_state['selected_action'] = None
-                                                st.session_state['retard_date'] = None
-                                                st.session_state['retard_time'] = None
-                                                st.rerun()
+                st.markdown(f"**{jour}**")
+    
+        # Dates et tâches
+        first_day, last_day = bornes_mois(current_year, current_month)
+        # Tâches du mois filtrées puis rangées par jour une seule fois
+        tasks = filtrer_taches(get_tasks_for_period(first_day, last_day), search, type_filter)
+        precharger(
+            bornes_mois(*decaler_mois(current_year, current_month, -1)),
+            bornes_mois(*decaler_mois(current_year, current_month, 1)),
+        )
+        taches_par_jour = grille_mois(tasks)
+        vide = tasks.iloc[0:0]
+        # Occurrences des récurrences, calculées pour ce mois seulement
+        recurrentes_par_jour = grille_mois(filtrer_taches(taches_recurrentes(first_day, last_day), search, type_filter))
+    
+        for week in cal:
+            cols = st.columns(7)
+            for i, day in enumerate(week):
+                with cols[i]:
+                    if day != 0:
+                        day_name = JOURS_SEMAINE[i]
+                        st.write(f"**{day_name} {day}**")
+                        for _, task in taches_par_jour.get(day, vide).iterrows():
+                            key = f"task_{task['tache_id']}_mois"
+                            style = STYLE_TERMINE if task.get('statut') == 'terminé' else STYLE_A_FAIRE
+                            if st.button(f"{task['titre']}", key=key):
+                                if st.session_state.get('selected_task') != task['tache_id']:
+                                    selectionner_tache(task)
+                                # Affichage détails si type r1/upsell/rdv
+                                if str(task.get('type_tache', '')).lower() in ['r1', 'upsell', 'rdv']:
+                                    if task.get('client_id'):
+                                        st.session_state['show_client_details'] = task['client_id']
+                            st.markdown(f'<div style="{style}">{task["titre"]}</div>', unsafe_allow_html=True)
+                            if st.session_state.get('selected_task') == task['tache_id']:
+                                formulaire_action_tache(task, key)
                             if st.button("Éditer", key=f"edit_{task['tache_id']}_mois"):
                                 st.session_state['edit_task_id'] = task['tache_id']
                                 st.rerun()
+                        if day in recurrentes_par_jour:
+                            st.markdown(
+                                "".join(bloc_recurrent(task) for _, task in recurrentes_par_jour[day].iterrows()),
+                                unsafe_allow_html=True
+                            )
 
-# --- Affichage dans la sidebar depuis le planning ---
-if st.session_state.get('show_client_details'):
-    id_ = st.session_state['show_client_details']
-    with sqlite3.connect(DB_PATH) as conn:
+    # --- Affichage dans la sidebar depuis le planning ---
+    if st.session_state.get('show_client_details'):
+        id_ = st.session_state['show_client_details']
         # On tente d'abord comme client_id
-        df_client = pd.read_sql_query("SELECT * FROM clients WHERE client_id = ?", conn, params=(id_,))
-        if not df_client.empty:
-            client = df_client.iloc[0]
+        client = fiche_client(id_)
+        if client is not None:
             st.sidebar.subheader(f"Client : {client.get('name', 'Non renseigné')}")
             st.sidebar.markdown(f"**Téléphone :** {client.get('phone', 'Non renseigné')}")
             if st.sidebar.button("Fermer", key=f"close_tel_details_{id_}"):
@@ -410,259 +491,251 @@ if st.session_state.get('show_client_details'):
             # Sinon, on tente comme place_id (prospect)
             # On cherche la tâche sélectionnée pour récupérer le champ 'service'
             tache_id = st.session_state.get('selected_task')
-            if tache_id:
-                df_tache = pd.read_sql_query("SELECT * FROM taches WHERE tache_id = ?", conn, params=(tache_id,))
-                if not df_tache.empty:
-                    place_id = df_tache.iloc[0].get('service')
-                    if place_id:
-                        df_prospect = pd.read_sql_query("SELECT * FROM prospects WHERE place_id = ?", conn, params=(place_id,))
-                        if not df_prospect.empty:
-                            prospect = df_prospect.iloc[0]
-                            st.sidebar.subheader(f"Prospect : {prospect.get('name', 'Non renseigné')}")
-                            st.sidebar.markdown(f"**Téléphone :** {prospect.get('phone', 'Non renseigné')}")
-                            if st.sidebar.button("Fermer", key=f"close_tel_details_{place_id}"):
-                                st.session_state['show_client_details'] = None
-                                st.rerun()
-            st.sidebar.warning("Aucun client ou prospect trouvé.")
+            tache = fiche_tache(int(tache_id)) if tache_id else None
+            place_id = tache.get('service') if tache is not None else None
+            prospect = fiche_prospect(place_id) if place_id else None
+            if prospect is not None:
+                st.sidebar.subheader(f"Prospect : {prospect.get('name', 'Non renseigné')}")
+                st.sidebar.markdown(f"**Téléphone :** {prospect.get('phone', 'Non renseigné')}")
+                if st.sidebar.button("Fermer", key=f"close_tel_details_{place_id}"):
+                    st.session_state['show_client_details'] = None
+                    st.rerun()
+            else:
+                st.sidebar.warning("Aucun client ou prospect trouvé.")
 
-with tab3:
-    st.subheader("Planning hebdomadaire")
+    with tab3:
+        st.subheader("Planning hebdomadaire")
     
-    # Navigation de la semaine
-    today = datetime.now()
-    start_of_week = today - timedelta(days=today.weekday())
+        # Navigation de la semaine (conservée en session)
+        if 'planning_semaine' not in st.session_state:
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            st.session_state['planning_semaine'] = today - timedelta(days=today.weekday())
     
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col1:
-        if st.button("Semaine précédente"):
-            start_of_week -= timedelta(days=7)
-    with col2:
-        st.write(f"Semaine du {start_of_week.strftime('%d/%m/%Y')} au {(start_of_week + timedelta(days=6)).strftime('%d/%m/%Y')}")
-    with col3:
-        if st.button("Semaine suivante"):
-            start_of_week += timedelta(days=7)
-
-    # Filtres
-    col1, col2 = st.columns(2)
-    with col1:
-        search_week = st.text_input("Rechercher...", placeholder="Client, titre ou type", key="search_week")
-    with col2:
-        type_filter_week = st.selectbox("Type", ["Tous"] + TYPES_TACHE, key="type_week")
-
-    # Récupération des tâches de la semaine
-    week_end = start_of_week + timedelta(days=7)
-    week_tasks = get_tasks_for_period(start_of_week, week_end)
-
-    # En-têtes des jours de la semaine
-    cols = st.columns(7)
-    for i, jour in enumerate(JOURS_SEMAINE):
-        with cols[i]:
-            current_day = start_of_week + timedelta(days=i)
-            st.markdown(f"**{jour} {current_day.strftime('%d/%m')}**")
-    
-    # Affichage du planning
-    for hour in HEURES_TRAVAIL:
-        st.write(f"**{hour}**")
-        cols = st.columns(7)
-        for i, day_offset in enumerate(range(7)):
-            current_day = start_of_week + timedelta(days=day_offset)
-            with cols[i]:
-                day_hour_tasks = week_tasks[
-                    (pd.to_datetime(week_tasks['date_debut']).dt.date == current_day.date()) &
-                    (pd.to_datetime(week_tasks['date_debut']).dt.strftime('%H:00') == hour)
-                ]
-                if not day_hour_tasks.empty:
-                    for _, task in day_hour_tasks.iterrows():
-                        if (not search_week or 
-                            search_week.lower() in str(task['client_name']).lower() or 
-                            search_week.lower() in str(task['titre']).lower() or 
-                            search_week.lower() in str(task['type_tache']).lower()):
-                            if type_filter_week == "Tous" or type_filter_week == task['type_tache']:
-                                key = f"task_{task['tache_id']}_hebdo"
-                                if task.get('statut') == 'terminé':
-                                    style = "background-color:#d4edda;color:#155724;font-weight:bold;border-radius:6px;padding:2px 6px;"
-                                else:
-                                    style = "background-color:#fff3cd;color:#856404;border-radius:6px;padding:2px 6px;"
-                                if st.button(f"{task['titre']} - {task['client_name'] if task['client_name'] else 'Process'}", key=key):
-                                    if st.session_state.get('selected_task') != task['tache_id']:
-                                        st.session_state['selected_task'] = task['tache_id']
-                                        st.session_state['selected_action'] = "Marquer comme complétée"
-                                        st.session_state['retard_date'] = pd.to_datetime(task['date_debut']).date()
-                                        st.session_state['retard_time'] = pd.to_datetime(task['date_debut']).time()
-                                st.markdown(f'<div style="{style}">{task["titre"]} - {task["client_name"] if task["client_name"] else "Process"}</div>', unsafe_allow_html=True)
-                                if st.session_state.get('selected_task') == task['tache_id']:
-                                    st.write(f"**Action sur la tâche : {task['titre']}**")
-                                    actions = ["Marquer comme complétée", "Retarder", "Annuler"]
-                                    selected_action = st.session_state.get('selected_action', actions[0])
-                                    action = st.radio("Action", actions, index=actions.index(selected_action), key=f"radio_{key}")
-                                    st.session_state['selected_action'] = action
-                                    with st.form(f"form_{key}"):
-                                        if action == "Retarder":
-                                            retard_date = st.date_input("Nouvelle date", value=st.session_state.get('retard_date', pd.to_datetime(task['date_debut']).date()), key=f"date_{key}")
-                                            retard_time = st.time_input("Nouvelle heure", value=st.session_state.get('retard_time', pd.to_datetime(task['date_debut']).time()), key=f"time_{key}")
-                                            st.session_state['retard_date'] = retard_date
-                                            st.session_state['retard_time'] = retard_time
-                                        col1, col2 = st.columns(2)
-                                        with col1:
-                                            submitted = st.form_submit_button("Valider")
-                                        with col2:
-                                            fermer = st.form_submit_button("Fermer")
-                                        if submitted:
-                                            with sqlite3.connect(DB_PATH) as conn:
-                                                c = conn.cursor()
-                                                if action == "Marquer comme complétée":
-                                                    c.execute("UPDATE taches SET statut='terminé' WHERE tache_id=?", (task['tache_id'],))
-                                                elif action == "Retarder":
-                                                    from datetime import datetime
-                                                    new_dt = datetime.combine(st.session_state['retard_date'], st.session_state['retard_time'])
-                                                    c.execute("UPDATE taches SET date_debut=?, statut='à faire' WHERE tache_id=?", (new_dt, task['tache_id']))
-                                                elif action == "Annuler":
-                                                    c.execute("DELETE FROM taches WHERE tache_id=?", (task['tache_id'],))
-                                                conn.commit()
-                                            st.success("Action effectuée !")
-                                            st.session_state['selected_task'] = None
-                                            st.session_state['selected_action'] = None
-                                            st.session_state['retard_date'] = None
-                                            st.session_state['retard_time'] = None
-                                            st.rerun()
-                                        if fermer:
-                                            st.session_state['selected_task'] = None
-                                            st.session_state['selected_action'] = None
-                                            st.session_state['retard_date'] = None
-                                            st.session_state['retard_time'] = None
-                                            st.rerun()
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("Semaine précédente", on_click=changer_semaine, args=(-1,))
+        with col3:
+            st.button("Semaine suivante", on_click=changer_semaine, args=(1,))
+        start_of_week = st.session_state['planning_semaine']
+        with col2:
+            st.write(f"Semaine du {start_of_week.strftime('%d/%m/%Y')} au {(start_of_week + timedelta(days=6)).strftime('%d/%m/%Y')}")
+
+        # Filtres
+        col1, col2 = st.columns(2)
+        with col1:
+            search_week = st.text_input("Rechercher...", placeholder="Client, titre ou type", key="search_week")
+        with col2:
+            type_filter_week = st.selectbox("Type", ["Tous"] + TYPES_TACHE, key="type_week")
+
+        # Récupération des tâches de la semaine, filtrées puis rangées par (jour, heure) une seule fois
+        week_end = start_of_week + timedelta(days=6)
+        week_tasks = filtrer_taches(get_tasks_for_period(start_of_week, week_end), search_week, type_filter_week)
+        precharger(
+            (start_of_week - timedelta(days=7), week_end - timedelta(days=7)),
+            (start_of_week + timedelta(days=7), week_end + timedelta(days=7)),
+        )
+        grille = grille_semaine(week_tasks)
+        vide = week_tasks.iloc[0:0]
+        grille_recurrentes = grille_semaine(
+            filtrer_taches(taches_recurrentes(start_of_week, week_end), search_week, type_filter_week)
+        )
+
+        # Mode d'affichage : grille compacte (HTML, heures utiles seulement) ou détaillée (boutons)
+        col1, col2 = st.columns(2)
+        with col1:
+            compact = st.toggle("Affichage compact", value=True, key="planning_compact")
+        with col2:
+            plage = st.slider("Heures de travail", 0, 24, PLAGE_TRAVAIL, key="plage_travail", disabled=not compact)
+
+        if compact:
+            jours = [(start_of_week + timedelta(days=i)).date() for i in range(7)]
+            lignes = lignes_semaine({**grille, **grille_recurrentes}, *plage)
+            st.markdown(html_semaine(grille, jours, lignes, grille_recurrentes), unsafe_allow_html=True)
+            # Une seule liste de sélection remplace les boutons par tâche
+            taches = {task['tache_id']: task for _, task in week_tasks.sort_values('date_debut').iterrows()}
+            choix = st.selectbox(
+                "Tâche", [None] + list(taches), key="tache_hebdo",
+                format_func=lambda t: "Sélectionner une tâche..." if t is None else
+                f"{pd.to_datetime(taches[t]['date_debut']).strftime('%a %d/%m %H:%M')} - {taches[t]['titre']} - {nom_client(taches[t])}",
+                on_change=choisir_tache_semaine, args=(taches,)
+            )
+            if choix is not None and st.session_state.get('selected_task') == choix:
+                formulaire_action_tache(taches[choix], f"task_{choix}_hebdo")
+                if st.button("Éditer", key=f"edit_{choix}_hebdo"):
+                    st.session_state['edit_task_id'] = choix
+                    st.rerun()
+        else:
+            # En-têtes des jours de la semaine
+            cols = st.columns(7)
+            for i, jour in enumerate(JOURS_SEMAINE):
+                with cols[i]:
+                    current_day = start_of_week + timedelta(days=i)
+                    st.markdown(f"**{jour} {current_day.strftime('%d/%m')}**")
+
+            for hour in HEURES_TRAVAIL:
+                st.write(f"**{hour}**")
+                cols = st.columns(7)
+                for i, day_offset in enumerate(range(7)):
+                    current_day = start_of_week + timedelta(days=day_offset)
+                    with cols[i]:
+                        for _, task in grille.get((current_day.date(), hour), vide).iterrows():
+                            key = f"task_{task['tache_id']}_hebdo"
+                            style = STYLE_TERMINE if task.get('statut') == 'terminé' else STYLE_A_FAIRE
+                            if st.button(f"{task['titre']} - {nom_client(task)}", key=key):
+                                if st.session_state.get('selected_task') != task['tache_id']:
+                                    selectionner_tache(task)
+                            st.markdown(f'<div style="{style}">{task["titre"]} - {nom_client(task)}</div>', unsafe_allow_html=True)
+                            if st.session_state.get('selected_task') == task['tache_id']:
+                                formulaire_action_tache(task, key)
                             if st.button("Éditer", key=f"edit_{task['tache_id']}_hebdo"):
                                 st.session_state['edit_task_id'] = task['tache_id']
                                 st.rerun()
+                        if (current_day.date(), hour) in grille_recurrentes:
+                            st.markdown(
+                                "".join(bloc_recurrent(task) for _, task in grille_recurrentes[(current_day.date(), hour)].iterrows()),
+                                unsafe_allow_html=True
+                            )
 
-# Bouton flottant d'ajout de tâche
-if st.button("➕", help="Ajouter une tâche"):
-    st.session_state.show_task_form = True
 
-if 'show_task_form' in st.session_state and st.session_state.show_task_form:
-    with st.form("new_task"):
-        st.subheader("Nouvelle tâche")
+    # Bouton flottant d'ajout de tâche
+    if st.button("➕", help="Ajouter une tâche"):
+        st.session_state.show_task_form = True
+
+    if 'show_task_form' in st.session_state and st.session_state.show_task_form:
+        with st.form("new_task"):
+            st.subheader("Nouvelle tâche")
         
-        # Choix client/process
-        est_process = st.checkbox("Process (sans client)")
-        if not est_process:
-            # Liste des clients
-            with sqlite3.connect(DB_PATH) as conn:
-                df_clients = pd.read_sql_query("SELECT client_id, name FROM clients", conn)
-            client_name_to_id = {row['name']: row['client_id'] for _, row in df_clients.iterrows()}
-            client_names = list(client_name_to_id.keys())
-            client_name = st.selectbox("Client", client_names)
-            client_id = client_name_to_id[client_name] if client_name else None
-            # Liste des commandes du client
-            if client_id:
-                with sqlite3.connect(DB_PATH) as conn:
-                    df_commandes = pd.read_sql_query(
+            # Choix client/process
+            est_process = st.checkbox("Process (sans client)")
+            if not est_process:
+                # Liste des clients
+                df_clients = lire("SELECT client_id, name FROM clients", tables=["clients"])
+                client_name_to_id = {row['name']: row['client_id'] for _, row in df_clients.iterrows()}
+                client_names = list(client_name_to_id.keys())
+                client_name = st.selectbox("Client", client_names)
+                client_id = client_name_to_id[client_name] if client_name else None
+                # Liste des commandes du client
+                if client_id:
+                    df_commandes = lire(
                         "SELECT commande_id, nom_service FROM commandes WHERE client_id = ?",
-                        conn, params=(int(client_id),)
+                        (int(client_id),), ["commandes"]
                     )
-                if not df_commandes.empty:
-                    commande_name_to_id = {row['nom_service']: row['commande_id'] for _, row in df_commandes.iterrows()}
-                    commande_names = list(commande_name_to_id.keys())
-                    commande_name = st.selectbox("Commande", commande_names)
-                    commande_id = commande_name_to_id[commande_name] if commande_name else None
-                else:
-                    st.info("Aucune commande trouvée pour ce client.")
-                    commande_id = None
-        else:
-            client_id = None
-            commande_id = None
+                    if not df_commandes.empty:
+                        commande_name_to_id = {row['nom_service']: row['commande_id'] for _, row in df_commandes.iterrows()}
+                        commande_names = list(commande_name_to_id.keys())
+                        commande_name = st.selectbox("Commande", commande_names)
+                        commande_id = commande_name_to_id[commande_name] if commande_name else None
+                    else:
+                        st.info("Aucune commande trouvée pour ce client.")
+                        commande_id = None
+            else:
+                client_id = None
+                commande_id = None
         
-        type_tache = st.selectbox("Type de tâche", TYPES_TACHE)
-        titre = st.text_input("Titre")
-        description = st.text_area("Description")
-        date = st.date_input("Date")
-        heure = st.time_input("Heure de début")
-        heure_fin = st.time_input("Heure de fin")
+            type_tache = st.selectbox("Type de tâche", TYPES_TACHE)
+            titre = st.text_input("Titre")
+            description = st.text_area("Description")
+            date = st.date_input("Date")
+            heure = st.time_input("Heure de début")
+            heure_fin = st.time_input("Heure de fin")
+            recurrence = st.selectbox("Récurrence", ["Non"] + list(RECURRENCES))
         
-        # --- Pré-remplissage du commentaire avec le numéro de téléphone pour r1/à rappeller ---
-        # À placer dans le formulaire d'ajout/édition de tâche (planning)
-        # Supposons que tu as une variable 'type_tache' et un champ commentaire
-        # Exemple pour l'ajout :
-        def get_phone_for_task(client_id, service):
-            with sqlite3.connect(DB_PATH) as conn:
-                if client_id:
-                    df = pd.read_sql_query("SELECT phone FROM clients WHERE client_id = ?", conn, params=(client_id,))
-                    if not df.empty:
-                        return df.iloc[0]['phone']
-                if service:
-                    df = pd.read_sql_query("SELECT phone FROM prospects WHERE place_id = ?", conn, params=(service,))
-                    if not df.empty:
-                        return df.iloc[0]['phone']
-            return ""
-        # ...
-        # Dans le formulaire :
-        if type_tache in ["r1", "à rappeller"]:
-            default_comment = get_phone_for_task(client_id, service)
-        else:
-            default_comment = ""
-        commentaire = st.text_area("Commentaire (optionnel)", value=default_comment, key="commentaire_form")
+            # --- Pré-remplissage du commentaire avec le numéro de téléphone pour r1/à rappeller ---
+            # À placer dans le formulaire d'ajout/édition de tâche (planning)
+            # Supposons que tu as une variable 'type_tache' et un champ commentaire
+            # Exemple pour l'ajout :
+            def get_phone_for_task(client_id, service):
+                with get_connection() as conn:
+                    if client_id:
+                        df = pd.read_sql_query("SELECT phone FROM clients WHERE client_id = ?", conn, params=(client_id,))
+                        if not df.empty:
+                            return df.iloc[0]['phone']
+                    if service:
+                        df = pd.read_sql_query("SELECT phone FROM prospects WHERE place_id = ?", conn, params=(service,))
+                        if not df.empty:
+                            return df.iloc[0]['phone']
+                return ""
+            # ...
+            # Dans le formulaire :
+            if type_tache in ["r1", "à rappeller"]:
+                default_comment = get_phone_for_task(client_id, None)
+            else:
+                default_comment = ""
+            commentaire = st.text_area("Commentaire (optionnel)", value=default_comment, key="commentaire_form")
+            forcer = st.checkbox("Ajouter même si le créneau est occupé")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.form_submit_button("Ajouter"):
-                if not titre:
-                    st.error("Le titre est obligatoire")
-                elif heure_fin <= heure:
-                    st.error("L'heure de fin doit être après l'heure de début")
-                else:
-                    with sqlite3.connect(DB_PATH) as conn:
-                        c = conn.cursor()
-                        date_debut = datetime.combine(date, heure)
-                        date_fin = datetime.combine(date, heure_fin)
-                        duree = (date_fin - date_debut).total_seconds() / 3600
-                        c.execute("""
-                            INSERT INTO taches (client_id, commande_id, type_tache, titre, description, 
-                                            date_debut, date_fin, temps_passe, est_process)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (client_id, commande_id, type_tache, titre, description, 
-                            date_debut, date_fin, duree, est_process))
-                        conn.commit()
-                    st.success("Tâche ajoutée avec succès !")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("Ajouter"):
+                    if not titre:
+                        st.error("Le titre est obligatoire")
+                    elif heure_fin <= heure:
+                        st.error("L'heure de fin doit être après l'heure de début")
+                    elif controler_creneau(datetime.combine(date, heure), datetime.combine(date, heure_fin), forcer=forcer):
+                        if commentaire:
+                            description = f"{description}\n{commentaire}" if description else commentaire
+                        with get_connection() as conn:
+                            c = conn.cursor()
+                            date_debut = datetime.combine(date, heure)
+                            date_fin = datetime.combine(date, heure_fin)
+                            duree = (date_fin - date_debut).total_seconds() / 3600
+                            c.execute("""
+                                INSERT INTO taches (client_id, commande_id, type_tache, titre, description, 
+                                                date_debut, date_fin, temps_passe, est_process, recurrence)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """, (client_id, commande_id, type_tache, titre, description, 
+                                horodatage(date_debut), horodatage(date_fin), duree, est_process,
+                                recurrence if recurrence != "Non" else None))
+                            conn.commit()
+                        st.success("Tâche ajoutée avec succès !")
+                        st.session_state.show_task_form = False
+                        st.rerun()
+            with col2:
+                if st.form_submit_button("Annuler"):
                     st.session_state.show_task_form = False
                     st.rerun()
-        with col2:
-            if st.form_submit_button("Annuler"):
-                st.session_state.show_task_form = False
-                st.rerun()
 
-# --- Formulaire d'édition de tâche si une tâche est sélectionnée pour édition ---
-if st.session_state.get('edit_task_id'):
-    tache_id = st.session_state['edit_task_id']
-    with sqlite3.connect(DB_PATH) as conn:
-        tache = pd.read_sql_query("SELECT * FROM taches WHERE tache_id = ?", conn, params=(tache_id,)).iloc[0]
-    with st.form(f"edit_task_{tache_id}"):
-        st.subheader("Modifier la tâche")
-        titre = st.text_input("Titre", value=tache['titre'])
-        description = st.text_area("Description", value=tache['description'])
-        date = st.date_input("Date", value=pd.to_datetime(tache['date_debut']).date())
-        heure = st.time_input("Heure de début", value=pd.to_datetime(tache['date_debut']).time())
-        heure_fin = st.time_input("Heure de fin", value=pd.to_datetime(tache['date_fin']).time() if pd.notnull(tache['date_fin']) else pd.to_datetime(tache['date_debut']).time())
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.form_submit_button("Enregistrer"):
-                if not titre:
-                    st.error("Le titre est obligatoire")
-                elif heure_fin <= heure:
-                    st.error("L'heure de fin doit être après l'heure de début")
-                else:
-                    with sqlite3.connect(DB_PATH) as conn:
-                        c = conn.cursor()
-                        date_debut = datetime.combine(date, heure)
-                        date_fin = datetime.combine(date, heure_fin)
-                        duree = (date_fin - date_debut).total_seconds() / 3600
-                        c.execute("""
-                            UPDATE taches SET titre=?, description=?, date_debut=?, date_fin=?, temps_passe=? WHERE tache_id=?
-                        """, (titre, description, date_debut, date_fin, duree, tache_id))
-                        conn.commit()
-                    st.success("Tâche modifiée avec succès !")
+    # --- Formulaire d'édition de tâche si une tâche est sélectionnée pour édition ---
+    if st.session_state.get('edit_task_id'):
+        tache_id = st.session_state['edit_task_id']
+        with get_connection() as conn:
+            tache = pd.read_sql_query("SELECT * FROM taches WHERE tache_id = ?", conn, params=(tache_id,)).iloc[0]
+        with st.form(f"edit_task_{tache_id}"):
+            st.subheader("Modifier la tâche")
+            titre = st.text_input("Titre", value=tache['titre'])
+            description = st.text_area("Description", value=tache['description'])
+            date = st.date_input("Date", value=pd.to_datetime(tache['date_debut']).date())
+            heure = st.time_input("Heure de début", value=pd.to_datetime(tache['date_debut']).time())
+            heure_fin = st.time_input("Heure de fin", value=pd.to_datetime(tache['date_fin']).time() if pd.notnull(tache['date_fin']) else pd.to_datetime(tache['date_debut']).time())
+            recurrences = ["Non"] + list(RECURRENCES)
+            recurrence = st.selectbox(
+                "Récurrence", recurrences,
+                index=recurrences.index(tache['recurrence']) if tache['recurrence'] in RECURRENCES else 0
+            )
+            forcer = st.checkbox("Enregistrer même si le créneau est occupé")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("Enregistrer"):
+                    if not titre:
+                        st.error("Le titre est obligatoire")
+                    elif heure_fin <= heure:
+                        st.error("L'heure de fin doit être après l'heure de début")
+                    elif controler_creneau(datetime.combine(date, heure), datetime.combine(date, heure_fin),
+                                           ignorer=int(tache_id), forcer=forcer):
+                        with get_connection() as conn:
+                            c = conn.cursor()
+                            date_debut = datetime.combine(date, heure)
+                            date_fin = datetime.combine(date, heure_fin)
+                            duree = (date_fin - date_debut).total_seconds() / 3600
+                            c.execute("""
+                                UPDATE taches SET titre=?, description=?, date_debut=?, date_fin=?, temps_passe=?, recurrence=? WHERE tache_id=?
+                            """, (titre, description, horodatage(date_debut), horodatage(date_fin), duree,
+                                  recurrence if recurrence != "Non" else None, tache_id))
+                            conn.commit()
+                        st.success("Tâche modifiée avec succès !")
+                        st.session_state['edit_task_id'] = None
+                        st.rerun()
+            with col2:
+                if st.form_submit_button("Annuler"):
                     st.session_state['edit_task_id'] = None
-                    st.rerun()
-        with col2:
-            if st.form_submit_button("Annuler"):
-                st.session_state['edit_task_id'] = None
-                st.rerun() 
\ No newline at end of file
+                    st.rerun() 
\ No newline at end of file
@@ -0,0 +1,51 @@
+import re
+
+from telephones import normaliser_telephone
+
+# --- Recherche plein texte (index FTS5 prospects_fts et clients_fts) ---
+# Les index sont tenus à jour par des triggers (voir migrations.py) : le
+# rowid de clients_fts est le client_id, celui de prospects_fts un fts_id
+# relié au place_id par prospects_fts_ids. Chaque mot saisi est cherché en
+# préfixe, sans tenir compte de la casse ni des accents.
+MOTS = r'\w+'
+SAISIE_TELEPHONE = r'[\d\s\-\.\+]+'
+
+
+def expression_fts(texte):
+    """Traduit une saisie libre en requête MATCH (None si rien à chercher)."""
+    texte = (texte or "").strip()
+    if re.fullmatch(SAISIE_TELEPHONE, texte) and re.search(r'\d', texte):
+        # Numéro saisi avec espaces ou +33 : même forme que les numéros stockés
+        mots = [normaliser_telephone(texte)]
+    else:
+        mots = re.findall(MOTS, texte)
+    if not mots:
+        return None
+    return " ".join(f'"{mot}"*' for mot in mots)
+
+
+def recherche_prospects(texte):
+    """Jointure et paramètres limitant prospects à la recherche, triés par pertinence.
+
+    Renvoie (jointure, condition, params, ordre) à insérer dans la requête,
+    ou des clauses vides si la saisie ne contient aucun mot.
+    """
+    expression = expression_fts(texte)
+    if expression is None:
+        return "", "", [], "prospects.rowid"
+    return (
+        " JOIN prospects_fts_ids ON prospects_fts_ids.prospect_id = prospects.place_id"
+        " JOIN prospects_fts ON prospects_fts.rowid = prospects_fts_ids.fts_id",
+        "prospects_fts MATCH ?", [expression], "prospects_fts.rank",
+    )
+
+
+def recherche_clients(texte):
+    """Même principe pour clients (rowid de l'index = client_id)."""
+    expression = expression_fts(texte)
+    if expression is None:
+        return "", "", [], "clients.client_id"
+    return (
+        " JOIN clients_fts ON clients_fts.rowid = clients.client_id",
+        "clients_fts MATCH ?", [expression], "clients_fts.rank",
+    )
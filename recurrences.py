@@ -0,0 +1,120 @@
+import calendar
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cache import lire, memoiser
+from db import horodatage
+
+# --- Récurrences des commandes et des tâches ---
+# Une commande ou une tâche récurrente est une seule ligne (sa colonne
+# recurrence est la règle, sa date_debut la première occurrence) : les
+# occurrences suivantes ne sont jamais écrites dans taches, elles sont
+# calculées à la demande pour la fenêtre affichée et mises en cache jusqu'à
+# la prochaine écriture dans commandes, taches ou clients.
+
+# règle -> (pas en jours, pas en mois)
+RECURRENCES = {
+    "2 semaines": (14, 0),
+    "1 mois": (0, 1),
+    "3 mois": (0, 3),
+    "6 mois": (0, 6),
+    "1 an": (0, 12),
+}
+
+COLONNES = [
+    "client_id", "commande_id", "type_tache", "titre", "date_debut", "date_fin",
+    "statut", "client_name", "nom_service", "recurrence",
+]
+
+
+def decaler(debut, recurrence, n):
+    """n-ième occurrence de la règle à partir de debut (jour ramené à la fin du mois si besoin)."""
+    jours, mois = RECURRENCES[recurrence]
+    if jours:
+        return debut + timedelta(days=jours * n)
+    index = debut.year * 12 + debut.month - 1 + mois * n
+    annee, mois_cible = index // 12, index % 12 + 1
+    return debut.replace(year=annee, month=mois_cible, day=min(debut.day, calendar.monthrange(annee, mois_cible)[1]))
+
+
+def occurrences(debut, recurrence, premier, dernier):
+    """Générateur des occurrences suivant debut comprises entre premier et dernier (jours inclus).
+
+    Le calcul part directement de la fenêtre : le coût dépend du nombre
+    d'occurrences affichées, pas de l'ancienneté de la règle.
+    """
+    jours, mois = RECURRENCES[recurrence]
+    if jours:
+        n = max(1, -(-(premier - debut.date()).days // jours))
+    else:
+        n = max(1, ((premier.year - debut.year) * 12 + premier.month - debut.month) // mois)
+    while True:
+        date = decaler(debut, recurrence, n)
+        if date.date() > dernier:
+            return
+        if date.date() >= premier:
+            yield date
+        n += 1
+
+
+def _regles(conn):
+    """Règles actives : commandes et tâches dont la récurrence est connue."""
+    valeurs = ",".join("?" * len(RECURRENCES))
+    commandes = lire(f"""
+        SELECT co.commande_id, co.client_id, co.nom_service, co.recurrence, co.date_debut,
+               c.name AS client_name
+        FROM commandes co LEFT JOIN clients c ON co.client_id = c.client_id
+        WHERE co.recurrence IN ({valeurs}) AND co.date_debut IS NOT NULL
+    """, list(RECURRENCES), ["commandes", "clients"], conn)
+    taches = lire(f"""
+        SELECT t.client_id, t.commande_id, t.type_tache, t.titre, t.date_debut, t.date_fin,
+               t.recurrence, c.name AS client_name, co.nom_service
+        FROM taches t
+        LEFT JOIN clients c ON t.client_id = c.client_id
+        LEFT JOIN commandes co ON t.commande_id = co.commande_id
+        WHERE t.recurrence IN ({valeurs}) AND t.date_debut IS NOT NULL
+    """, list(RECURRENCES), ["taches", "clients", "commandes"], conn)
+    return commandes, taches
+
+
+def _etendre(conn, premier, dernier):
+    commandes, taches = _regles(conn)
+    lignes = []
+    for _, regle in commandes.iterrows():
+        debut = pd.to_datetime(regle["date_debut"], errors="coerce")
+        if pd.isna(debut):
+            continue
+        for date in occurrences(debut.to_pydatetime(), regle["recurrence"], premier, dernier):
+            lignes.append((
+                regle["client_id"], regle["commande_id"], "maintenance",
+                f"{regle['nom_service']} ({regle['recurrence']})", horodatage(date), None,
+                "à faire", regle["client_name"], regle["nom_service"], regle["recurrence"],
+            ))
+    for _, regle in taches.iterrows():
+        debut = pd.to_datetime(regle["date_debut"], errors="coerce")
+        if pd.isna(debut):
+            continue
+        fin = pd.to_datetime(regle["date_fin"], errors="coerce")
+        duree = fin - debut if pd.notna(fin) else None
+        for date in occurrences(debut.to_pydatetime(), regle["recurrence"], premier, dernier):
+            lignes.append((
+                regle["client_id"], regle["commande_id"], regle["type_tache"], regle["titre"],
+                horodatage(date), horodatage(date + duree) if duree is not None else None,
+                "à faire", regle["client_name"], regle["nom_service"], regle["recurrence"],
+            ))
+    return pd.DataFrame(lignes, columns=COLONNES)
+
+
+def taches_recurrentes(premier, dernier, conn=None):
+    """Occurrences calculées entre premier et dernier (jours inclus), colonnes COLONNES.
+
+    Ces lignes n'existent pas en base (pas de tache_id) : elles s'affichent
+    à côté des tâches de get_tasks_for_period sans pouvoir être modifiées.
+    """
+    premier = premier.date() if isinstance(premier, datetime) else premier
+    dernier = dernier.date() if isinstance(dernier, datetime) else dernier
+    return memoiser(
+        ("recurrences", premier, dernier), ["commandes", "taches", "clients"],
+        lambda: _etendre(conn, premier, dernier), conn
+    ).copy()
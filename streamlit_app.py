@@ -1,10 +1,20 @@
 import streamlit as st
-import sqlite3
+from db import get_connection, horodatage
+from migrations import init_db
+from import_jobs import soumettre_import, lister_jobs, rejets_job, demarrer_worker, STATUTS_ACTIFS
+from telephones import normaliser_telephone
+from recherche import recherche_prospects
+from metriques import calculer_metriques, tableau
+from cache import lire
+from fiches import fiche_prospect
+from ecritures import vider_si_inactif
+from creneaux import controler_creneau, DUREE_PAR_DEFAUT
 import pandas as pd
 import os
+import importlib
+import ast
 from datetime import datetime
 import hashlib
-import re
 from glob import glob
 import requests
 
@@ -12,101 +22,9 @@ import requests
 st.set_page_config(page_title="CRM Agence", layout="wide")
 
 # --- Initialisation de la base de données ---
-DB_PATH = "crm_data.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Table des prospects
-    c.execute('''CREATE TABLE IF NOT EXISTS prospects (
-        place_id TEXT PRIMARY KEY,
-        name TEXT,
-        website TEXT,
-        phone TEXT,
-        emails TEXT,
-        main_category TEXT,
-        categories TEXT,
-        reviews INTEGER,
-        rating REAL,
-        address TEXT,
-        horaires TEXT,
-        link TEXT,
-        featured_reviews TEXT,
-        is_spending_on_ads TEXT,
-        query TEXT,
-        statut_appel TEXT DEFAULT '',
-        date_dernier_appel TEXT DEFAULT '',
-        meta_appel TEXT DEFAULT ''
-    )''')
-    # Table des clients
-    c.execute('''CREATE TABLE IF NOT EXISTS clients (
-        client_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        place_id TEXT,
-        name TEXT,
-        phone TEXT,
-        address TEXT,
-        date_conversion TEXT,
-        last_contact TEXT,
-        FOREIGN KEY(place_id) REFERENCES prospects(place_id)
-    )''')
-    # Table des prestations/commandes
-    c.execute('''CREATE TABLE IF NOT EXISTS commandes (
-        commande_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        client_id INTEGER,
-        nom_service TEXT,
-        prestation TEXT,
-        prix REAL,
-        recurrence TEXT,
-        date_debut TEXT,
-        date_fin TEXT,
-        argent_encaisse REAL,
-        statut TEXT,
-        temps_passe TEXT,
-        FOREIGN KEY(client_id) REFERENCES clients(client_id)
-    )''')
-    # Table historique des statuts
-    c.execute('''CREATE TABLE IF NOT EXISTS historique_statuts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        place_id TEXT,
-        statut TEXT,
-        date_changement TEXT,
-        FOREIGN KEY (place_id) REFERENCES prospects (place_id)
-    )''')
-    # Table des tâches (ajoutée pour éviter l'erreur SQL)
-    c.execute('''CREATE TABLE IF NOT EXISTS taches (
-        tache_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        client_id INTEGER,
-        commande_id INTEGER,
-        type_tache TEXT,
-        titre TEXT,
-        description TEXT,
-        date_debut DATETIME,
-        date_fin DATETIME,
-        temps_passe FLOAT,
-        statut TEXT DEFAULT 'à faire',
-        est_process BOOLEAN DEFAULT 0,
-        service TEXT,
-        FOREIGN KEY(client_id) REFERENCES clients(client_id),
-        FOREIGN KEY(commande_id) REFERENCES commandes(commande_id)
-    )''')
-    
-    # Ajouter la colonne nom_service si elle n'existe pas
-    try:
-        c.execute("ALTER TABLE commandes ADD COLUMN nom_service TEXT")
-    except:
-        pass  # La colonne existe déjà
-    
-    # Correctif ponctuel : donner un nom de service par défaut aux commandes qui n'en ont pas
-    c.execute("""
-        UPDATE commandes
-        SET nom_service = 'Service par défaut'
-        WHERE nom_service IS NULL OR nom_service = ''
-    """)
-    
-    conn.commit()
-    conn.close()
-
 init_db()
+# Reprend les imports interrompus par un redémarrage du serveur
+demarrer_worker()
 
 st.title("CRM Agence - Prospection & Clients")
 
@@ -114,99 +32,106 @@ st.title("CRM Agence - Prospection & Clients")
 st.header("Importer des prospects (CSV)")
 file = st.file_uploader("Choisir un fichier CSV", type=["csv"])
 
-if file:
-    df = pd.read_csv(file)
-    # Vérification des champs obligatoires
-    erreurs = []
-    lignes_valides = []
-    
-    def is_french_mobile(phone):
-        """Vérifie si le numéro est un mobile français valide"""
-        if not isinstance(phone, str) or not phone.strip():
-            return False
-        # Nettoie le numéro (supprime espaces, tirets, points)
-        phone_clean = re.sub(r'[\s\-\.]', '', phone.strip())
-        # Regex pour mobile français: 06/07 ou +336/+337 suivi de 8 chiffres
-        return bool(re.match(r'^(0|\+33)[67]\d{8}$', phone_clean))
-    
-    for idx, row in df.iterrows():
-        nom = str(row.get("name", "")).strip()
-        tel = str(row.get("phone", "")).strip()
-        adresse = str(row.get("address", "")).strip()
-        
-        # Filtre numéro mobile FR uniquement
-        if not is_french_mobile(tel):
-            erreurs.append(f"Ligne {idx+2} ignorée : numéro non mobile FR (06, 07, +336, +337). Numéro: {tel}")
-            continue
-            
-        if not (nom and tel and adresse):
-            erreurs.append(f"Ligne {idx+2} ignorée : nom/téléphone/adresse manquant.")
-            continue
-            
-        # Normalise le numéro pour stockage (format 0X XX XX XX XX)
-        tel_clean = re.sub(r'[\s\-\.]', '', tel)
-        if tel_clean.startswith('+33'):
-            tel_clean = '0' + tel_clean[3:]
-        
-        # Gestion du doublon : on met à jour si le téléphone existe déjà
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM prospects WHERE phone=?", (tel_clean,))
-            exists = c.fetchone()
-            if exists:
-                # Mise à jour
-                c.execute("""
-                    UPDATE prospects SET
-                        place_id=?, name=?, website=?, emails=?, main_category=?, categories=?, reviews=?, rating=?, address=?, horaires=?, link=?, featured_reviews=?, is_spending_on_ads=?, query=?
-                    WHERE phone=?
-                """, (
-                    str(row.get("place_id", "")).strip(),
-                    nom,
-                    row.get("website", ""),
-                    row.get("emails", ""),
-                    row.get("main_category", ""),
-                    str(row.get("categories", "")),
-                    row.get("reviews", 0),
-                    row.get("rating", 0),
-                    adresse,
-                    row.get("horaires", ""),
-                    row.get("link", ""),
-                    str(row.get("featured_reviews", "")),
-                    str(row.get("is_spending_on_ads", "")),
-                    row.get("query", ""),
-                    tel_clean
-                ))
-            else:
-                # Insertion
-                c.execute("""
-                    INSERT INTO prospects (place_id, name, website, phone, emails, main_category, categories, reviews, rating, address, horaires, link, featured_reviews, is_spending_on_ads, query)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    str(row.get("place_id", "")).strip(),
-                    nom,
-                    row.get("website", ""),
-                    tel_clean,
-                    row.get("emails", ""),
-                    row.get("main_category", ""),
-                    str(row.get("categories", "")),
-                    row.get("reviews", 0),
-                    row.get("rating", 0),
-                    adresse,
-                    row.get("horaires", ""),
-                    row.get("link", ""),
-                    str(row.get("featured_reviews", "")),
-                    str(row.get("is_spending_on_ads", "")),
-                    row.get("query", "")
-                ))
-            conn.commit()
-        lignes_valides.append(nom)
-    st.success(f"{len(lignes_valides)} prospects importés/mis à jour.")
-    if erreurs:
-        st.warning("\n".join(erreurs))
+if file and st.session_state.get("_import_soumis") != file.file_id:
+    # Le fichier est traité en tâche de fond, par morceaux : l'interface reste disponible
+    soumettre_import(get_connection(), file.name, file.getvalue())
+    st.session_state["_import_soumis"] = file.file_id
+
+REJETS_AFFICHES = 50
+
+
+def afficher_imports(conn, jobs):
+    """Avancement ou bilan des derniers imports."""
+    for job in jobs.itertuples():
+        if job.statut in STATUTS_ACTIFS:
+            total = job.lignes_total or 0
+            avancement = min(job.lignes_traitees / total, 1.0) if total else 0.0
+            st.progress(avancement, text=f"Import de {job.nom_fichier} ({job.statut}) : "
+                                         f"{job.lignes_traitees}/{total or '?'} lignes")
+        elif job.statut == "erreur":
+            st.error(f"Import de {job.nom_fichier} interrompu : {job.erreur.splitlines()[0] if job.erreur else ''}")
+        else:
+            st.success(f"{job.nom_fichier} : {job.inseres + job.mis_a_jour} prospects importés/mis à jour "
+                       f"({job.inseres} nouveaux, {job.mis_a_jour} mis à jour, "
+                       f"{job.inchanges} inchangés).")
+            if job.rejetes:
+                with st.expander(f"{job.rejetes} lignes ignorées"):
+                    st.text("\n".join(f"Ligne {ligne} ignorée : {raison}"
+                                       for ligne, raison in rejets_job(conn, job.job_id, REJETS_AFFICHES)))
+                    if job.rejetes > REJETS_AFFICHES:
+                        st.caption(f"... et {job.rejetes - REJETS_AFFICHES} autres.")
+
+
+@st.fragment(run_every="2s")
+def suivre_imports():
+    """Imports en cours, rafraîchis sans relancer toute la page."""
+    conn = get_connection()
+    jobs = lister_jobs(conn, limite=3)
+    afficher_imports(conn, jobs)
+    if not jobs["statut"].isin(STATUTS_ACTIFS).any():
+        st.rerun()  # plus rien en cours : la page repasse au bilan statique
+
+
+# Le rafraîchissement périodique n'existe que pendant un import
+jobs_recents = lister_jobs(get_connection(), limite=3)
+if jobs_recents["statut"].isin(STATUTS_ACTIFS).any():
+    suivre_imports()
+else:
+    afficher_imports(get_connection(), jobs_recents)
 
 # --- Statuts d'appel (fixes) ---
 STATUTS = ["n'a pas répondu", "à rappeller", "r1", "pas intérréssé", "signé"]
 
+# Colonnes affichées dans la liste des prospects : les textes volumineux
+# (avis, horaires, catégories) ne sont lus qu'à l'ouverture du panneau Détails
+COLONNES_LISTE_PROSPECTS = ["place_id", "name", "main_category", "address", "phone", "statut_appel", "date_dernier_appel"]
+AVIS_AFFICHES = 3
+TAILLES_PAGE = [25, 50, 100, 200]
+
+
+def filtres_prospects(texte="", appel="Tous", statut="Tous"):
+    """Clauses FROM/WHERE paramétrées et tri correspondant aux filtres de la liste."""
+    jointure, condition, params, ordre = recherche_prospects(texte)
+    conditions = [condition] if condition else []
+    if appel == "Appelé":
+        conditions.append("COALESCE(statut_appel, '') != ''")
+    elif appel == "Non appelé":
+        conditions.append("COALESCE(statut_appel, '') = ''")
+    if statut != "Tous":
+        conditions.append("statut_appel = ?")
+        params.append(statut)
+    source = f" FROM prospects{jointure}" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+    return source, params, ordre
+
+
+def compter_prospects(source, params):
+    with get_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*){source}", params).fetchone()[0]
+
+
+def ids_prospects(source, params):
+    """Identifiants de tous les prospects filtrés (sélection bulk)."""
+    with get_connection() as conn:
+        return [pid for (pid,) in conn.execute(f"SELECT prospects.place_id{source}", params)]
+
+
+def charger_page_prospects(source, params, ordre, taille, page):
+    """Une page de la liste (page numérotée à partir de 1), par pertinence ou ordre d'insertion."""
+    colonnes = ", ".join(f"prospects.{col}" for col in COLONNES_LISTE_PROSPECTS)
+    return lire(
+        f"SELECT {colonnes}{source} ORDER BY {ordre} LIMIT ? OFFSET ?",
+        (*params, taille, (page - 1) * taille), ["prospects"]
+    )
+
+
+def lire_avis(texte):
+    """Avis mis en avant, stockés tels que scrapés (liste de dicts Python)."""
+    try:
+        avis = ast.literal_eval(texte) if texte else []
+    except (ValueError, SyntaxError):
+        return []
+    return [a for a in avis if isinstance(a, dict) and a.get('review_text')]
+
 # --- Navigation ---
 PAGES = [
     "Dashboard",
@@ -220,6 +145,21 @@ PAGES = [
     "Générateur de site"
 ]
 page = st.sidebar.radio("Navigation", PAGES, index=4)
+# Cases cochées encore en attente : écrites dès que l'on change de page
+vider_si_inactif(page)
+
+# --- Pages définies dans leur propre module (exposent render()) ---
+PAGES_MODULES = {
+    "KPI Prospection": "kpi_prospection",
+    "Planning": "planning",
+    "CRM Clients": "crm_clients",
+    "Commandes": "commandes",
+    "Checklists": "checklists",
+}
+
+def charger_page(page):
+    """Importe le module de la page une seule fois par processus (cache de sys.modules)."""
+    return importlib.import_module(PAGES_MODULES[page])
 
 if page == "Prospection":
     st.title("Prospection")
@@ -243,7 +183,8 @@ if page == "Prospection":
             else:
                 import hashlib
                 place_id = hashlib.md5(lien.encode()).hexdigest()
-                with sqlite3.connect(DB_PATH) as conn:
+                telephone = normaliser_telephone(telephone)
+                with get_connection() as conn:
                     c = conn.cursor()
                     c.execute("SELECT * FROM prospects WHERE phone=?", (telephone,))
                     exists = c.fetchone()
@@ -259,53 +200,51 @@ if page == "Prospection":
                         st.rerun()
 
     st.header("Liste des prospects")
-    # Première ligne de filtres
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        filtre_nom = st.text_input("Rechercher par nom...")
-    with col2:
-        filtre_tel = st.text_input("Rechercher par téléphone...")
-    with col3:
-        filtre_cat = st.text_input("Rechercher par catégorie...")
-    with col4:
-        filtre_adr = st.text_input("Rechercher par adresse...")
+    # Recherche plein texte (début de mot, sans casse ni accents)
+    recherche = st.text_input("Rechercher (nom, catégorie, adresse, téléphone, requête)...")
     
     # Deuxième ligne de filtres
     st.write("")
     st.markdown("**Filtrer par statut d'appel :**")
     filtre_appel = st.radio("", ["Tous", "Non appelé", "Appelé"], horizontal=True, label_visibility="collapsed")
     
-    # Récupération des prospects
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.read_sql_query("SELECT * FROM prospects", conn)
-    # Application des filtres
-    if filtre_nom:
-        df = df[df['name'].str.contains(filtre_nom, case=False, na=False)]
-    if filtre_tel:
-        df = df[df['phone'].str.contains(filtre_tel, case=False, na=False)]
-    if filtre_cat:
-        df = df[df['main_category'].str.contains(filtre_cat, case=False, na=False)]
-    if filtre_adr:
-        df = df[df['address'].str.contains(filtre_adr, case=False, na=False)]
-
-    # Application du filtre 'Appelé / Non appelé'
-    if 'filtre_appel' in locals() and filtre_appel != "Tous":
-        if filtre_appel == "Appelé":
-            df = df[df['statut_appel'].fillna('') != '']
-        elif filtre_appel == "Non appelé":
-            df = df[df['statut_appel'].fillna('') == '']
+    # --- Filtre d'appel rapide ---
+    st.write("")
+    st.markdown("**Filtrer par statut d'appel (rapide) :**")
+    filtre_rapide = st.selectbox("Statut d'appel", ["Tous"] + STATUTS, key="filtre_rapide")
+
+    # Filtres appliqués en SQL : seules la page affichée et le total sont lus
+    source, params, ordre = filtres_prospects(recherche, filtre_appel, filtre_rapide)
+    total = compter_prospects(source, params)
 
     st.write("")
     st.subheader("Tableau des prospects")
-    if df.empty:
+    if total == 0:
         st.info("Aucun prospect trouvé.")
     else:
+        # --- Pagination (retour à la première page quand les filtres changent) ---
+        signature_filtres = (source, tuple(params))
+        if st.session_state.get('filtres_prospects') != signature_filtres:
+            st.session_state['filtres_prospects'] = signature_filtres
+            st.session_state['page_prospects'] = 1
+        col_taille, col_page, col_info = st.columns([1, 1, 2])
+        with col_taille:
+            taille_page = st.selectbox("Prospects par page", TAILLES_PAGE, key="taille_page_prospects")
+        nb_pages = max((total - 1) // taille_page + 1, 1)
+        if st.session_state.get('page_prospects', 1) > nb_pages:
+            st.session_state['page_prospects'] = nb_pages
+        with col_page:
+            page_courante = st.number_input("Page", min_value=1, max_value=nb_pages, step=1, key="page_prospects")
+        with col_info:
+            debut = (page_courante - 1) * taille_page
+            st.caption(f"Prospects {debut + 1}–{min(debut + taille_page, total)} sur {total} (page {page_courante}/{nb_pages})")
+        df_affiche = charger_page_prospects(source, params, ordre, taille_page, page_courante)
+
         # --- Sélection bulk ---
         selection = st.session_state.get('selection', set())
         if not isinstance(selection, set):
             selection = set()
-        all_ids = df['place_id'].tolist()
-        
+
         # Initialiser la sélection individuelle si elle n'existe pas
         if 'selected_individual' not in st.session_state:
             st.session_state['selected_individual'] = None
@@ -313,20 +252,13 @@ if page == "Prospection":
             st.session_state['show_statut_popup'] = None
             
         # Affichage de la case 'Tout sélectionner' au-dessus du tableau
-        select_all = st.checkbox("Tout sélectionner pour bulk", value=len(selection)==len(all_ids) and len(all_ids)>0, key="select_all_checkbox")
-        if select_all and len(selection) != len(all_ids):
-            selection = set(all_ids)
-        elif not select_all and len(selection) == len(all_ids):
+        # (porte sur tous les prospects filtrés, pas seulement la page affichée)
+        select_all = st.checkbox("Tout sélectionner pour bulk", value=len(selection)==total, key="select_all_checkbox")
+        if select_all and len(selection) != total:
+            selection = set(ids_prospects(source, params))
+        elif not select_all and len(selection) == total:
             selection = set()
-            
-        # --- Filtre d'appel rapide (menu à droite) ---
-        st.write("")
-        st.markdown("**Filtrer par statut d'appel (rapide) :**")
-        filtre_rapide = st.selectbox("Statut d'appel", ["Tous"] + STATUTS, key="filtre_rapide")
-        df_affiche = df.copy()
-        if filtre_rapide != "Tous":
-            df_affiche = df_affiche[df_affiche['statut_appel'] == filtre_rapide]
-            
+
         # Affichage du tableau avec colonnes dédiées
         col_sel, col_nom, col_cat, col_adr, col_tel, col_date, col_details, col_statut = st.columns([1,3,2,3,2,2,2,2])
         with col_sel:
@@ -393,8 +325,8 @@ if page == "Prospection":
 
         # --- Popup pour changer le statut d'appel individuellement ---
         show_statut_popup = st.session_state.get('show_statut_popup', None)
-        if show_statut_popup:
-            prospect_popup = df[df['place_id'] == show_statut_popup].iloc[0]
+        prospect_popup = fiche_prospect(show_statut_popup) if show_statut_popup else None
+        if prospect_popup is not None:
             st.sidebar.subheader(f"Changer le statut d'appel pour {prospect_popup['name']}")
             st.sidebar.markdown(f"**Statut actuel :** {prospect_popup['statut_appel'] if prospect_popup['statut_appel'] else 'Non défini'}")
             statut_choisi = None
@@ -402,7 +334,7 @@ if page == "Prospection":
                 if st.sidebar.button(f"✅ {statut}", key=f"popup_statut_{statut}_{show_statut_popup}"):
                     statut_choisi = statut
             if statut_choisi:
-                with sqlite3.connect(DB_PATH) as conn:
+                with get_connection() as conn:
                     c = conn.cursor()
                     now = datetime.now().strftime("%Y-%m-%d %H:%M")
                     c.execute("UPDATE prospects SET statut_appel=?, date_dernier_appel=? WHERE place_id=?", 
@@ -424,8 +356,8 @@ if page == "Prospection":
 
         # --- En dehors de la popup, si planning_popup est défini, afficher le mini-formulaire
         planning_popup = st.session_state.get('planning_popup', None)
-        if planning_popup and planning_popup['statut'] in ['r1', 'à rappeller']:
-            prospect = df[df['place_id'] == planning_popup['place_id']].iloc[0]
+        prospect = fiche_prospect(planning_popup['place_id']) if planning_popup else None
+        if prospect is not None and planning_popup['statut'] in ['r1', 'à rappeller']:
             st.sidebar.subheader(f"Ajouter un rappel au planning pour {prospect['name']}")
             default_comment = f"{prospect['phone']}" if prospect.get('phone') else ""
             with st.sidebar.form(f"form_planning_{prospect['place_id']}"):
@@ -433,11 +365,12 @@ if page == "Prospection":
                 date = st.date_input("Date", value=datetime.now().date())
                 heure = st.time_input("Heure", value=datetime.now().time().replace(second=0, microsecond=0))
                 commentaire = st.text_area("Commentaire (optionnel)", value=default_comment)
+                forcer = st.checkbox("Ajouter même si le créneau est occupé")
                 submit_planning = st.form_submit_button("Ajouter au planning")
-                if submit_planning:
-                    with sqlite3.connect(DB_PATH) as conn:
+                debut_rappel = datetime.combine(date, heure)
+                if submit_planning and controler_creneau(debut_rappel, debut_rappel + DUREE_PAR_DEFAUT, forcer=forcer):
+                    with get_connection() as conn:
                         c = conn.cursor()
-                        date_debut = datetime.combine(date, heure)
                         c.execute("""
                             INSERT INTO taches (client_id, commande_id, type_tache, titre, description, date_debut, est_process, service)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
@@ -447,7 +380,7 @@ if page == "Prospection":
                             planning_popup['statut'],
                             titre,
                             commentaire,
-                            date_debut,
+                            horodatage(debut_rappel),
                             1,  # est_process = True (pas lié à un client)
                             prospect['place_id']  # <-- place_id stocké dans 'service'
                         ))
@@ -463,7 +396,7 @@ if page == "Prospection":
         if selection:
             st.sidebar.subheader("Actions sur la sélection (bulk)")
             if st.sidebar.button("Supprimer la sélection", type="primary"):
-                with sqlite3.connect(DB_PATH) as conn:
+                with get_connection() as conn:
                     c = conn.cursor()
                     c.executemany("DELETE FROM prospects WHERE place_id=?", [(pid,) for pid in selection])
                     conn.commit()
@@ -473,7 +406,7 @@ if page == "Prospection":
             st.sidebar.markdown("**Changer le statut d'appel (bulk) :**")
             for statut in STATUTS:
                 if st.sidebar.button(statut, key=f"statut_bulk_{statut}"):
-                    with sqlite3.connect(DB_PATH) as conn:
+                    with get_connection() as conn:
                         c = conn.cursor()
                         now = datetime.now().strftime("%Y-%m-%d %H:%M")
                         for pid in selection:
@@ -487,8 +420,8 @@ if page == "Prospection":
 
         # --- Popup de transfert en client ---
         show_transfer = st.session_state.get('show_transfer', None)
-        if show_transfer:
-            prospect = df[df['place_id'] == show_transfer].iloc[0]
+        prospect = fiche_prospect(show_transfer) if show_transfer else None
+        if prospect is not None:
             st.sidebar.subheader(f"Transférer {prospect['name']} en client")
             with st.sidebar.form(f"form_transfer_{show_transfer}"):
                 nom_service = st.text_input("Nom du service *", "")
@@ -503,7 +436,7 @@ if page == "Prospection":
                     if not (nom_service and date_debut and date_fin and prix):
                         st.error("Merci de remplir tous les champs obligatoires.")
                     else:
-                        with sqlite3.connect(DB_PATH) as conn:
+                        with get_connection() as conn:
                             c = conn.cursor()
                             # Création du client
                             c.execute("""
@@ -532,8 +465,13 @@ if page == "Prospection":
                                 encaisse,
                                 "active"
                             ))
-                            # Suppression du prospect
-                            c.execute("DELETE FROM prospects WHERE place_id=?", (prospect['place_id'],))
+                            # Le prospect reste en base, marqué signé : la fiche client lit
+                            # encore sa catégorie, son site et sa note
+                            now = datetime.now().strftime("%Y-%m-%d %H:%M")
+                            c.execute("UPDATE prospects SET statut_appel=?, date_dernier_appel=? WHERE place_id=?",
+                                      ("signé", now, prospect['place_id']))
+                            c.execute("INSERT INTO historique_statuts (place_id, statut, date_changement) VALUES (?, ?, ?)",
+                                      (prospect['place_id'], "signé", now))
                             conn.commit()
                         st.success("Prospect transféré en client avec succès !")
                         st.session_state['show_transfer'] = None
@@ -545,8 +483,8 @@ if page == "Prospection":
 
         # --- Affichage des détails dans un panneau latéral ---
         show_details = st.session_state.get('show_details', None)
-        if show_details:
-            detail_row = df[df['place_id'] == show_details].iloc[0]
+        detail_row = fiche_prospect(show_details) if show_details else None
+        if detail_row is not None:
             st.sidebar.subheader(f"Détails pour {detail_row['name']}")
             st.sidebar.markdown(f"**Catégorie :** {detail_row['main_category']}")
             st.sidebar.markdown(f"**Adresse :** {detail_row['address']}")
@@ -555,11 +493,18 @@ if page == "Prospection":
             st.sidebar.markdown(f"**Email :** {'[Email](mailto:' + detail_row['emails'] + ')' if detail_row['emails'] else 'Non dispo'}")
             st.sidebar.markdown(f"**Lien Google Maps :** {'[Maps](' + detail_row['link'] + ')' if detail_row['link'] else 'Non dispo'}")
             st.sidebar.markdown(f"**Avis :** {detail_row['reviews']} | **Note :** {detail_row['rating']}")
+            if detail_row['horaires']:
+                st.sidebar.markdown(f"**Horaires :** {detail_row['horaires']}")
+            avis = lire_avis(detail_row['featured_reviews'])
+            if avis:
+                with st.sidebar.expander(f"Avis mis en avant ({len(avis)})"):
+                    for a in avis[:AVIS_AFFICHES]:
+                        st.markdown(f"**{a.get('rating', '-')}/5** — {a['review_text']}")
             st.sidebar.markdown(f"**Statut appel :** {detail_row['statut_appel'] if detail_row['statut_appel'] else 'Non renseigné'}")
             st.sidebar.markdown("**Changer le statut d'appel individuellement :**")
             for statut in STATUTS:
                 if st.sidebar.button(statut, key=f"statut_indiv_{statut}_{detail_row['place_id']}"):
-                    with sqlite3.connect(DB_PATH) as conn:
+                    with get_connection() as conn:
                         c = conn.cursor()
                         now = datetime.now().strftime("%Y-%m-%d %H:%M")
                         c.execute("UPDATE prospects SET statut_appel=?, date_dernier_appel=? WHERE place_id=?", (statut, now, detail_row['place_id']))
@@ -573,125 +518,60 @@ if page == "Prospection":
                 st.session_state['show_details'] = None
                 st.rerun()
 
-elif page == "KPI Prospection":
-    with open("kpi_prospection.py", encoding="utf-8") as f:
-        exec(f.read(), globals())
-
-elif page == "Planning":
-    with open("planning.py", encoding="utf-8") as f:
-        exec(f.read(), globals())
+elif page in PAGES_MODULES:
+    charger_page(page).render()
 
 # Autres pages (Dashboard, CRM Clients, etc.) - à implémenter selon vos besoins
 elif page == "Dashboard":
     st.title("Dashboard")
     st.subheader("Productivité du jour")
-    # --- Récupération des données ---
+    # --- Récupération des données (une requête groupée par table) ---
     today = datetime.now().date()
-    yesterday = today - pd.Timedelta(days=1)
-    last_week = today - pd.Timedelta(days=7)
-    with sqlite3.connect(DB_PATH) as conn:
-        # Appels aujourd'hui, hier, S-1
-        appels_today = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='tache'", conn, params=(today,)).iloc[0]['n']
-        appels_yesterday = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='tache'", conn, params=(yesterday,)).iloc[0]['n']
-        appels_lastweek = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='tache'", conn, params=(last_week,)).iloc[0]['n']
-        # RDV
-        rdv_today = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='r1'", conn, params=(today,)).iloc[0]['n']
-        rdv_yesterday = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='r1'", conn, params=(yesterday,)).iloc[0]['n']
-        rdv_lastweek = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND type_tache='r1'", conn, params=(last_week,)).iloc[0]['n']
-        # Missions finies
-        missions_today = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND statut='terminé'", conn, params=(today,)).iloc[0]['n']
-        missions_yesterday = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND statut='terminé'", conn, params=(yesterday,)).iloc[0]['n']
-        missions_lastweek = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)=? AND statut='terminé'", conn, params=(last_week,)).iloc[0]['n']
-        # Heures travaillées
-        heures_today = pd.read_sql_query("SELECT SUM(temps_passe) as h FROM taches WHERE date(date_debut)=?", conn, params=(today,)).iloc[0]['h'] or 0
-        heures_yesterday = pd.read_sql_query("SELECT SUM(temps_passe) as h FROM taches WHERE date(date_debut)=?", conn, params=(yesterday,)).iloc[0]['h'] or 0
-        heures_lastweek = pd.read_sql_query("SELECT SUM(temps_passe) as h FROM taches WHERE date(date_debut)=?", conn, params=(last_week,)).iloc[0]['h'] or 0
+    with get_connection() as conn:
+        metriques = calculer_metriques(conn, today)
+    valeur = metriques.set_index(["metrique", "periode"])["valeur"]
     # --- Tableau productivité ---
-    prod = pd.DataFrame({
-        "": ["Appels", "RDV", "Missions finies", "Heures travaillées"],
-        "Aujourd'hui": [appels_today, rdv_today, missions_today, heures_today],
-        "Hier": [appels_yesterday, rdv_yesterday, missions_yesterday, heures_yesterday],
-        "Même jour S-1": [appels_lastweek, rdv_lastweek, missions_lastweek, heures_lastweek],
-    })
-    st.table(prod)
+    prod = tableau(metriques, ["appels", "rdv", "missions", "heures"], ["aujourdhui", "hier", "meme_jour_s1"])
+    prod.index = ["Appels", "RDV", "Missions finies", "Heures travaillées"]
+    prod.columns = ["Aujourd'hui", "Hier", "Même jour S-1"]
+    st.table(prod.rename_axis("").reset_index())
     # --- Indicateurs clés semaine ---
-    semaine = today.isocalendar()[1]
-    annee = today.year
-    lundi = today - pd.Timedelta(days=today.weekday())
-    dimanche = lundi + pd.Timedelta(days=6)
-    with sqlite3.connect(DB_PATH) as conn:
-        facture = pd.read_sql_query("SELECT SUM(prix) as s FROM commandes WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi, dimanche)).iloc[0]['s'] or 0
-        encaisse = pd.read_sql_query("SELECT SUM(argent_encaisse) as s FROM commandes WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi, dimanche)).iloc[0]['s'] or 0
-        appels = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND type_tache='tache'", conn, params=(lundi, dimanche)).iloc[0]['n']
-        rdv = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND type_tache='r1'", conn, params=(lundi, dimanche)).iloc[0]['n']
-        nouveaux_clients = pd.read_sql_query("SELECT COUNT(*) as n FROM clients WHERE date(date_conversion)>=? AND date(date_conversion)<=?", conn, params=(lundi, dimanche)).iloc[0]['n']
-        missions = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND statut='terminé'", conn, params=(lundi, dimanche)).iloc[0]['n']
-        projets_retard = pd.read_sql_query("SELECT COUNT(*) as n FROM commandes WHERE date(date_fin)<? AND statut!='livré'", conn, params=(today,)).iloc[0]['n']
-        # Taux horaire moyen
-        heures = pd.read_sql_query("SELECT SUM(temps_passe) as h FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi, dimanche)).iloc[0]['h'] or 0
-        taux_horaire = round(facture / heures, 2) if heures else 0
+    facture = valeur["facture", "semaine"]
+    encaisse = valeur["encaisse", "semaine"]
+    taux_horaire = valeur["taux_horaire", "semaine"]
     col1, col2, col3, col4, col5, col6, col7, col8 = st.columns(8)
     col1.metric("Facturé cette semaine", f"{facture:,.0f} €")
     col2.metric("Encaissé cette semaine", f"{encaisse:,.0f} €")
-    col3.metric("Appels passés", appels)
-    col4.metric("RDV générés", rdv)
-    col5.metric("Nouveaux clients", nouveaux_clients)
+    col3.metric("Appels passés", valeur["appels", "semaine"])
+    col4.metric("RDV générés", valeur["rdv", "semaine"])
+    col5.metric("Nouveaux clients", valeur["nouveaux_clients", "semaine"])
     col6.metric("{}/h".format(taux_horaire if taux_horaire else 0), "Taux horaire moyen")
-    col7.metric("Missions terminées", missions)
-    col8.metric("Projets en retard", projets_retard)
+    col7.metric("Missions terminées", valeur["missions", "semaine"])
+    col8.metric("Projets en retard", valeur["projets_retard", "aujourdhui"])
     # --- Comparatif semaine/semaine ---
     st.subheader("Comparatif Semaine/Semaine")
-    lundi_prec = lundi - pd.Timedelta(days=7)
-    dimanche_prec = lundi_prec + pd.Timedelta(days=6)
-    with sqlite3.connect(DB_PATH) as conn:
-        facture_prec = pd.read_sql_query("SELECT SUM(prix) as s FROM commandes WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['s'] or 0
-        encaisse_prec = pd.read_sql_query("SELECT SUM(argent_encaisse) as s FROM commandes WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['s'] or 0
-        appels_prec = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND type_tache='tache'", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['n']
-        rdv_prec = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND type_tache='r1'", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['n']
-        nouveaux_clients_prec = pd.read_sql_query("SELECT COUNT(*) as n FROM clients WHERE date(date_conversion)>=? AND date(date_conversion)<=?", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['n']
-        missions_prec = pd.read_sql_query("SELECT COUNT(*) as n FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=? AND statut='terminé'", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['n']
-        heures_prec = pd.read_sql_query("SELECT SUM(temps_passe) as h FROM taches WHERE date(date_debut)>=? AND date(date_debut)<=?", conn, params=(lundi_prec, dimanche_prec)).iloc[0]['h'] or 0
-        taux_horaire_prec = round(facture_prec / heures_prec, 2) if heures_prec else 0
     def evol(val, prec):
         if prec == 0:
             return "+100%" if val > 0 else "0%"
         return f"{((val-prec)/prec)*100:+.1f}%"
+    COMPARATIF = [
+        ("facture", "Facturé", "{:,.0f} €"),
+        ("encaisse", "Encaissé", "{:,.0f} €"),
+        ("appels", "Appels", "{}"),
+        ("rdv", "RDV", "{}"),
+        ("nouveaux_clients", "Nouveaux clients", "{}"),
+        ("taux_horaire", "Taux horaire", "{} €/h"),
+        ("missions", "Missions terminées", "{}"),
+    ]
+    semaines = tableau(metriques, [nom for nom, _, _ in COMPARATIF], ["semaine", "semaine_prec"])
     comp = pd.DataFrame({
-        "Indicateur": ["Facturé", "Encaissé", "Appels", "RDV", "Nouveaux clients", "Taux horaire", "Missions terminées"],
-        "Cette semaine": [
-            f"{facture:,.0f} €",
-            f"{encaisse:,.0f} €",
-            str(appels),
-            str(rdv),
-            str(nouveaux_clients),
-            f"{taux_horaire} €/h",
-            str(missions)
-        ],
-        "Semaine dernière": [
-            f"{facture_prec:,.0f} €",
-            f"{encaisse_prec:,.0f} €",
-            str(appels_prec),
-            str(rdv_prec),
-            str(nouveaux_clients_prec),
-            f"{taux_horaire_prec} €/h",
-            str(missions_prec)
-        ],
-        "Évolution": [evol(facture, facture_prec), evol(encaisse, encaisse_prec), evol(appels, appels_prec), evol(rdv, rdv_prec), evol(nouveaux_clients, nouveaux_clients_prec), evol(taux_horaire, taux_horaire_prec), evol(missions, missions_prec)]
+        "Indicateur": [libelle for _, libelle, _ in COMPARATIF],
+        "Cette semaine": [fmt.format(semaines.loc[nom, "semaine"]) for nom, _, fmt in COMPARATIF],
+        "Semaine dernière": [fmt.format(semaines.loc[nom, "semaine_prec"]) for nom, _, fmt in COMPARATIF],
+        "Évolution": [evol(semaines.loc[nom, "semaine"], semaines.loc[nom, "semaine_prec"]) for nom, _, _ in COMPARATIF],
     })
     st.table(comp)
 
-elif page == "CRM Clients":
-    with open("crm_clients.py", encoding="utf-8") as f:
-        exec(f.read(), globals())
-    
-elif page == "Commandes":
-    with open("commandes.py", encoding="utf-8") as f:
-        exec(f.read(), globals())
-
-elif page == "Checklists":
-    with open("checklists.py", encoding="utf-8") as f:
-        exec(f.read(), globals())
-
 elif page == "Automatisation":
     st.title("Automatisation")
     sous_page = st.radio("Choisissez une section :", ["Facture", "Site internet"])
@@ -0,0 +1,74 @@
+import re
+
+import pandas as pd
+
+from db import connect
+
+# --- Normalisation des numéros de téléphone ---
+# Forme canonique : chiffres seuls, préfixe +33 remplacé par 0 (ex. 0612345678).
+# Le téléphone sert de clé de dédoublonnage des prospects, il doit donc être
+# stocké sous cette forme quelle que soit la saisie (import, formulaire).
+SEPARATEURS = r'[\s\-\.]'
+PREFIXE_INTERNATIONAL = r'^\+33'
+MOBILE_FR = r'0[67]\d{8}'
+
+
+def normaliser_telephones(serie):
+    """Normalise toute une colonne de numéros en une passe.
+
+    Renvoie (numéros canoniques, masque des mobiles français valides :
+    06, 07, +336, +337 suivis de 8 chiffres).
+    """
+    canonique = (
+        serie.fillna("").astype(str).str.strip()
+        .str.replace(SEPARATEURS, '', regex=True)
+        .str.replace(PREFIXE_INTERNATIONAL, '0', regex=True)
+    )
+    return canonique, canonique.str.fullmatch(MOBILE_FR).fillna(False).astype(bool)
+
+
+def normaliser_telephone(phone):
+    """Version unitaire, pour les saisies manuelles."""
+    tel = re.sub(SEPARATEURS, '', str(phone or "").strip())
+    return re.sub(PREFIXE_INTERNATIONAL, '0', tel)
+
+
+def _renormaliser_table(c, table, cle):
+    lignes = pd.DataFrame(c.execute(f"SELECT {cle}, phone FROM {table}").fetchall(), columns=[cle, "phone"])
+    if lignes.empty:
+        return 0, []
+    lignes["canonique"], _ = normaliser_telephones(lignes["phone"])
+    a_modifier = lignes[lignes["canonique"] != lignes["phone"].fillna("")]
+    conflits = []
+    if table == "prospects":
+        # Deux fiches qui deviennent identiques violeraient l'index unique : on les laisse telles quelles
+        doublons = lignes["canonique"].duplicated(keep=False) & (lignes["canonique"] != "")
+        conflits = a_modifier.loc[doublons[a_modifier.index], cle].tolist()
+        a_modifier = a_modifier[~doublons[a_modifier.index]]
+    c.executemany(
+        f"UPDATE {table} SET phone = ? WHERE {cle} = ?",
+        [(canonique or None, id_) for id_, canonique in zip(a_modifier[cle], a_modifier["canonique"])]
+    )
+    return len(a_modifier), conflits
+
+
+def renormaliser_telephones(c):
+    """Remet à la forme canonique les numéros déjà stockés (prospects et clients).
+
+    Tâche ponctuelle, lancée par les migrations puis à la demande via
+    `python telephones.py`. Travaille sur le curseur fourni, sans commit.
+    """
+    nb_prospects, conflits = _renormaliser_table(c, "prospects", "place_id")
+    nb_clients, _ = _renormaliser_table(c, "clients", "client_id")
+    return {"prospects": nb_prospects, "clients": nb_clients, "conflits": conflits}
+
+
+if __name__ == "__main__":
+    conn = connect()
+    with conn:
+        resultat = renormaliser_telephones(conn.cursor())
+    conn.close()
+    print(f"Prospects mis à jour : {resultat['prospects']}")
+    print(f"Clients mis à jour : {resultat['clients']}")
+    if resultat["conflits"]:
+        print("Prospects non modifiés (numéro déjà utilisé par une autre fiche) :", ", ".join(resultat["conflits"]))